@@ -1,18 +1,26 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Depends, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ASCENDING, UpdateOne, ReturnDocument
+from pymongo.errors import OperationFailure, BulkWriteError
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from bson import json_util
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import uuid
 from datetime import datetime, timedelta
 import json
 import asyncio
-from collections import defaultdict
+import time
+import re
+from contextlib import contextmanager
+from collections import defaultdict, OrderedDict, Counter
 import numpy as np
 
 ROOT_DIR = Path(__file__).parent
@@ -23,8 +31,231 @@ mongo_url = os.environ.get('MONGO_URL')
 client = AsyncIOMotorClient(mongo_url)
 db = client["world_data"]  # Using the world_data database as specified
 
+# Uploaded rows live in their own database so public catalog scans stay O(public datasets)
+UPLOADS_DB_NAME = os.environ.get('UPLOADS_DB_NAME', 'world_data_uploads')
+UPLOADS_COLLECTION = "file_rows"
+uploads_db = client[UPLOADS_DB_NAME]
+
+# Read routing: analytics and export reads may be served by secondaries, login and uploads stay on the primary.
+# Each profile is configured with READ_PREFERENCE_<PROFILE> and READ_MAX_STALENESS_<PROFILE> (seconds, -1 = unbounded),
+# and each endpoint's profile can be overridden with READ_PROFILE_<ENDPOINT>. Reads of non-public collections, and of
+# collections whose data version moved within READ_AFTER_WRITE_SECONDS, always go to the primary.
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+READ_PROFILE_DEFAULTS = {"primary": "primary", "analytics": "secondaryPreferred", "export": "secondaryPreferred"}
+ENDPOINT_READ_PROFILES = {
+    "data_filtered": "export",
+    "insights_enhanced": "analytics",
+    "aggregate": "analytics",
+    "chat": "analytics",
+    "visualize": "analytics",
+    "insights": "analytics",
+}
+READ_AFTER_WRITE_SECONDS = int(os.environ.get('READ_AFTER_WRITE_SECONDS', '120'))
+
+def build_read_preference(profile: str):
+    """Build the read preference for a routing profile from the environment"""
+    mode = os.environ.get(f'READ_PREFERENCE_{profile.upper()}', READ_PROFILE_DEFAULTS[profile])
+    max_staleness = int(os.environ.get(f'READ_MAX_STALENESS_{profile.upper()}', '-1'))
+    preference_class = READ_PREFERENCE_MODES.get(mode)
+    if preference_class is None:
+        logging.warning(f"Unknown read preference {mode} for {profile} reads, using primary")
+        preference_class = Primary
+    if preference_class is Primary:
+        return Primary()
+    if 0 <= max_staleness < 90:
+        max_staleness = 90  # smallest value MongoDB accepts
+    return preference_class(max_staleness=max_staleness)
+
+read_databases = {
+    profile: client.get_database("world_data", read_preference=build_read_preference(profile))
+    for profile in READ_PROFILE_DEFAULTS
+}
+
+def read_db(profile: str):
+    """Database handle carrying the read preference of a routing profile"""
+    return read_databases.get(profile, db)
+
+def endpoint_read_profile(endpoint: str) -> str:
+    """Routing profile used by an endpoint"""
+    return os.environ.get(f'READ_PROFILE_{endpoint.upper()}', ENDPOINT_READ_PROFILES.get(endpoint, "primary"))
+
+def routed_read_profile(collection_name: str, profile: str) -> str:
+    """Profile for reading one collection: the primary for uploads and recently written data, else the requested profile"""
+    if collection_name not in PUBLIC_COLLECTIONS:
+        return "primary"  # uploads are read right after they are written
+    changed_at = data_version_changed_at.get(collection_name)
+    if changed_at is not None and datetime.utcnow() - changed_at < timedelta(seconds=READ_AFTER_WRITE_SECONDS):
+        return "primary"  # a lagging secondary could still serve the previous version
+    return profile
+
+def read_collection(collection_name: str, profile: str):
+    """Collection handle for a read, routed with routed_read_profile"""
+    return read_db(routed_read_profile(collection_name, profile))[collection_name]
+
+# Public datasets shared by all users
+PUBLIC_COLLECTIONS = ["crimes", "literacy", "aqi", "power_consumption", "covid_stats"]
+
+# Declarative index registry for public collections (collection -> index name -> keys).
+# Every index ends with _id so any key prefix gives a unique, index-backed keyset pagination order.
+INDEX_REGISTRY = {
+    "crimes": {
+        "state_year": [("state", ASCENDING), ("year", ASCENDING), ("_id", ASCENDING)],
+        "crime_type_state_year": [("crime_type", ASCENDING), ("state", ASCENDING), ("year", ASCENDING), ("_id", ASCENDING)],
+        "year": [("year", ASCENDING), ("_id", ASCENDING)],
+        "cases_reported": [("cases_reported", ASCENDING), ("_id", ASCENDING)],
+    },
+    "literacy": {
+        "state_year": [("state", ASCENDING), ("year", ASCENDING), ("_id", ASCENDING)],
+        "year": [("year", ASCENDING), ("_id", ASCENDING)],
+        "literacy_rate": [("literacy_rate", ASCENDING), ("_id", ASCENDING)],
+    },
+    "aqi": {
+        "state_year": [("state", ASCENDING), ("year", ASCENDING), ("_id", ASCENDING)],
+        "year": [("year", ASCENDING), ("_id", ASCENDING)],
+        "avg_aqi": [("avg_aqi", ASCENDING), ("_id", ASCENDING)],
+    },
+    "power_consumption": {
+        "state_year": [("state", ASCENDING), ("year", ASCENDING), ("_id", ASCENDING)],
+        "year": [("year", ASCENDING), ("_id", ASCENDING)],
+        "consumption": [("consumption", ASCENDING), ("_id", ASCENDING)],
+    },
+    "covid_stats": {
+        "state_year_month": [("state", ASCENDING), ("year", ASCENDING), ("month", ASCENDING), ("_id", ASCENDING)],
+        "year_month": [("year", ASCENDING), ("month", ASCENDING), ("_id", ASCENDING)],
+        "date": [("date", ASCENDING), ("_id", ASCENDING)],
+    },
+}
+
+# In-process catalog of collection names, refreshed periodically and on ingest
+CATALOG_TTL_SECONDS = int(os.environ.get('CATALOG_TTL_SECONDS', '300'))
+collection_catalog = {"names": set(), "refreshed_at": None}
+
+# In-memory columnar copy of the public datasets (MongoDB stays the source of truth)
+PUBLIC_STORE_TTL_SECONDS = int(os.environ.get('PUBLIC_STORE_TTL_SECONDS', '600'))
+PUBLIC_STORE_MASK_FIELDS = ["state", "year", "crime_type"]
+public_data_store = {}  # collection name -> columnar snapshot, tagged with the data version it was loaded at
+public_store_refreshing = set()
+
+# Fire-and-forget tasks (refreshes, rebuilds), referenced until they finish so they cannot be garbage-collected
+background_tasks = set()
+
+# Data version per collection, bumped whenever its contents are known to change
+collection_data_versions = defaultdict(int)
+data_version_changed_at = {}  # collection name -> time of the last bump (reads pin to the primary for a while)
+
+# LRU+TTL cache for /api/data/filtered and /api/insights/enhanced results
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL_SECONDS', '300'))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '512'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+result_cache = OrderedDict()  # cache key -> entry
+result_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidated": 0, "bytes": 0}
+
+# Pre-aggregated state x year x category rollup cubes, rebuilt with $group/$merge on refresh
+ROLLUP_COLLECTION_PREFIX = "rollup_"
+ROLLUP_CUBES = {
+    "crimes": {"dimensions": ["state", "year", "crime_type"], "measures": ["cases_reported"]},
+    "literacy": {"dimensions": ["state", "year"], "measures": ["literacy_rate"]},
+    "aqi": {"dimensions": ["state", "year"], "measures": ["avg_aqi"]},
+    "power_consumption": {"dimensions": ["state", "year"], "measures": ["consumption", "power_consumption_gwh"]},
+    "covid_stats": {"dimensions": ["state", "year"], "measures": ["confirmed", "deaths", "recovered"]},
+}
+AGGREGATE_FUNCTIONS = ["sum", "avg", "min", "max", "count"]
+# Collections whose chat answers (generate_specific_response) read a measure summary
+MEASURE_SUMMARY_COLLECTIONS = ["crimes", "literacy", "aqi", "power_consumption"]
+rollup_cube_status = {}  # collection name -> {"built_at", "version"}
+
+# Per-state weekly/monthly rollups of daily collections, extended incrementally as new days arrive
+TIME_BUCKET_ROLLUPS = {
+    "covid_stats": {"date_field": "date", "dimensions": ["state"], "measures": ["confirmed", "deaths", "recovered"]},
+}
+TIME_BUCKET_GRANULARITIES = ["week", "month"]
+# Requested span in days -> finest granularity worth returning; longer spans use months
+TIME_BUCKET_AUTO_SPANS = [(92, "day"), (731, "week")]
+TIME_BUCKET_MAX_ROWS = int(os.environ.get('TIME_BUCKET_MAX_ROWS', '5000'))
+time_bucket_status = defaultdict(dict)  # collection name -> granularity -> {"built_at"}; watermarks live in the bucket collections
+time_bucket_building = set()
+
+# Metadata cached per collection and data version; writers publish version bumps to data_versions,
+# which other processes follow with a change stream on it (or by polling it on standalone servers)
+DATA_VERSIONS_COLLECTION = "data_versions"
+PROCESS_ID = uuid.uuid4().hex  # origin tag on this process's publishes so it skips its own events
+DATA_VERSION_POLL_SECONDS = int(os.environ.get('DATA_VERSION_POLL_SECONDS', '30'))
+metadata_cache = {}  # collection name -> {"version", "metadata", "cached_at"}
+
+# Schema discovery samples documents instead of trusting the first one
+SCHEMA_SAMPLE_SIZE = int(os.environ.get('SCHEMA_SAMPLE_SIZE', '1000'))
+schema_cache = {}  # (database name, collection name, match key) -> {"version", "schema"}
+upload_schema_cache = OrderedDict()  # same keys for per-file schemas, least recently used first, capped like upload statistics
+data_version_watch = {"mode": None, "seen": {}}  # invalidation mode and last seen published versions
+
+# Per-field distinct counts, histograms and null ratios for public collections and uploaded files
+FIELD_STATS_BINS = int(os.environ.get('FIELD_STATS_BINS', '10'))
+FIELD_STATS_TOP_VALUES = int(os.environ.get('FIELD_STATS_TOP_VALUES', '20'))
+FIELD_STATS_LOW_CARDINALITY = 12  # categorical fields up to this many values suit pie/doughnut charts
+ROLLUP_MAX_CELL_RATIO = float(os.environ.get('ROLLUP_MAX_CELL_RATIO', '0.5'))  # skip cubes nearly as large as the raw data
+FIELD_STATS_MAX_UPLOADS = int(os.environ.get('FIELD_STATS_MAX_UPLOADS', '256'))  # uploaded files described at once
+field_statistics = {}  # collection name -> {"version", "records", "fields", "computed_at"}
+upload_field_statistics = OrderedDict()  # ("upload", file_id) -> same entry shape, least recently used first
+
+# Platform stats served from memory by /api/stats and refreshed in the background
+PLATFORM_STATS_REFRESH_SECONDS = int(os.environ.get('PLATFORM_STATS_REFRESH_SECONDS', '60'))
+platform_stats = {"snapshot": None, "refreshed_at": None}
+
+# Usage counters buffered in memory per (endpoint, dataset) and flushed to MongoDB with $inc in batches
+USAGE_COUNTERS_COLLECTION = "usage_counters"
+USAGE_FLUSH_SECONDS = int(os.environ.get('USAGE_FLUSH_SECONDS', '5'))
+USAGE_METRICS = {
+    "visualize": "visualizations",
+    "data_filtered": "visualizations",
+    "aggregate": "visualizations",
+    "insights": "insights",
+    "insights_enhanced": "insights",
+    "user_insights": "insights",
+    "chat": "chat_queries",
+}
+usage_pending = defaultdict(int)  # (endpoint, dataset) -> increments not yet flushed
+usage_totals = defaultdict(int)  # (endpoint, dataset) -> flushed totals
+
+# In-process scheduler for periodic refresh and maintenance jobs
+SCHEDULER_JITTER_RATIO = float(os.environ.get('SCHEDULER_JITTER_RATIO', '0.1'))
+ROLLUP_REFRESH_SECONDS = int(os.environ.get('ROLLUP_REFRESH_SECONDS', '300'))
+MAINTENANCE_INTERVAL_SECONDS = int(os.environ.get('MAINTENANCE_INTERVAL_SECONDS', '60'))
+SESSION_TTL_HOURS = int(os.environ.get('SESSION_TTL_HOURS', '24'))
+scheduled_jobs = {}  # job name -> {"interval", "func", "running", "runs", "failures", "skipped", ...}
+scheduler_tasks = []
+
+# Startup warm-up state reported by /api/ready
+readiness = {"ready": False, "started_at": None, "warmed_at": None, "steps": {}}
+
+# Persisted dataset registry: description, count and real last-modified time per collection
+DATASET_REGISTRY_COLLECTION = "dataset_registry"
+DATASETS_CACHE_MAX_AGE = int(os.environ.get('DATASETS_CACHE_MAX_AGE', '60'))
+dataset_registry = {}  # collection name -> registry document
+dataset_catalog = {"key": None, "body": None, "etag": None, "last_modified": None}
+
+# Collections that must never be listed as datasets: bookkeeping, accounts, file metadata
+# and the per-user upload collections written before uploads moved to their own database
+INTERNAL_COLLECTION_PREFIXES = (
+    "system.", ROLLUP_COLLECTION_PREFIX, DATA_VERSIONS_COLLECTION, DATASET_REGISTRY_COLLECTION, USAGE_COUNTERS_COLLECTION,
+    "users", "user_"
+)
+
+# In-flight computations shared by concurrent identical calls (single-flight)
+inflight_calls = {}  # call key -> asyncio.Task
+
+# Batch query limits
+BATCH_MAX_QUERIES = int(os.environ.get('BATCH_MAX_QUERIES', '20'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '4'))
+
 # Security setup
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Simple session storage (in production, use Redis or database)
 active_sessions = {}
@@ -43,6 +274,18 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     return active_sessions[token]
 
+# Query debugging (explain + stage timings), enabled per request with this header by authenticated users
+def get_query_debug(
+    x_debug_query: Optional[str] = Header(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> Optional[Dict[str, Any]]:
+    """Return a debug collector when X-Debug-Query is set by an authenticated user, otherwise None"""
+    if not x_debug_query or x_debug_query.lower() not in ("1", "true", "yes"):
+        return None
+    if credentials is None or credentials.credentials not in active_sessions:
+        raise HTTPException(status_code=403, detail="Query debugging requires an authenticated session")
+    return {"timings_ms": {}, "explain": {}}
+
 # Pydantic Models
 class User(BaseModel):
     email: EmailStr
@@ -104,6 +347,10 @@ class StatsResponse(BaseModel):
     total_datasets: int
     total_insights: int
 
+class SortSpec(BaseModel):
+    field: str
+    order: Optional[str] = "asc"  # asc or desc
+
 class FilterRequest(BaseModel):
     collection: str
     states: Optional[List[str]] = None
@@ -111,21 +358,49 @@ class FilterRequest(BaseModel):
     crime_types: Optional[List[str]] = None
     sort_by: Optional[str] = None
     sort_order: Optional[str] = "asc"  # asc or desc
+    sort: Optional[List[SortSpec]] = None  # Multi-key sort, enables keyset pagination
+    page_token: Optional[str] = None  # next_page_token from a previous page
     limit: Optional[int] = 100
     chart_type: Optional[str] = "bar"  # For AI insights context
 
+class MeasureSpec(BaseModel):
+    field: str  # "*" counts rows
+    function: Optional[str] = "sum"  # sum, avg, min, max or count
+
+class AggregateRequest(BaseModel):
+    collection: str
+    states: Optional[List[str]] = None
+    years: Optional[List[int]] = None
+    crime_types: Optional[List[str]] = None
+    dimensions: List[str] = []
+    measures: List[MeasureSpec]
+    pivot: Optional[str] = None  # Dimension whose values become columns
+    limit: Optional[int] = 1000
+
+class BatchQuery(BaseModel):
+    id: Optional[str] = None  # Echoed back so clients can match results
+    type: str  # filtered, aggregate, insights or metadata
+    filter: Optional[FilterRequest] = None  # For filtered and insights
+    aggregate: Optional[AggregateRequest] = None  # For aggregate
+    collection: Optional[str] = None  # For metadata
+
+class BatchRequest(BaseModel):
+    queries: List[BatchQuery]
+
 class CollectionMetadata(BaseModel):
     collection: str
     available_states: List[str]
     available_years: List[int]
     available_fields: List[str]
     special_filters: Dict[str, List[str]] = {}  # e.g., crime_types for crimes collection
+    field_schema: List[Dict[str, Any]] = []  # sampled types and fill rate per field
 
 # Import required modules for authentication
 import hashlib
 import random
 import string
 import io
+import base64
 import pandas as pd
 
 # Helper functions for authentication
@@ -176,8 +451,8 @@ async def process_uploaded_file(file_content: bytes, filename: str, user_id: str
         # Convert DataFrame to list of dictionaries for MongoDB
         records = df.to_dict('records')
         
-        # Create user-specific collection name
-        collection_name = f"user_{user_id}_files"
+        # All uploads share one collection in the uploads database, keyed by user_id and file_id
+        collection_name = UPLOADS_COLLECTION
         
         # Add metadata to each record
         for record in records:
@@ -186,8 +461,15 @@ async def process_uploaded_file(file_content: bytes, filename: str, user_id: str
             record['upload_date'] = datetime.utcnow()
             record['user_id'] = user_id
         
-        # Store in MongoDB
-        await db[collection_name].insert_many(records)
+        # Store in MongoDB (a new file never changes another file's rows, so no data version moves)
+        await uploads_db[collection_name].insert_many(records)
+        try:
+            store_field_statistics(
+                ("upload", file_id), 0, build_columns(records),
+                exclude=('_id', 'file_id', 'user_id', 'filename', 'upload_date')
+            )
+        except Exception as e:
+            logging.error(f"Field statistics error for upload {file_id}: {e}")
         
         # Store file metadata
         file_metadata = {
@@ -197,6 +479,7 @@ async def process_uploaded_file(file_content: bytes, filename: str, user_id: str
             'upload_date': datetime.utcnow(),
             'record_count': len(records),
             'file_type': file_type,
+            'database': UPLOADS_DB_NAME,
             'collection_name': collection_name
         }
         
@@ -212,44 +495,1558 @@ async def process_uploaded_file(file_content: bytes, filename: str, user_id: str
         logging.error(f"File processing error: {e}")
         raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
 
+# Helper functions for uploaded file storage
+def upload_rows(file_metadata: Dict[str, Any]):
+    """Collection holding an uploaded file's rows (files uploaded before the uploads database keep their per-user collection)"""
+    if file_metadata.get('database') == UPLOADS_DB_NAME:
+        return uploads_db[file_metadata['collection_name']]
+    return db[file_metadata['collection_name']]
+
+async def ensure_upload_indexes():
+    """Index the shared uploads collection by file and by tenant"""
+    await uploads_db[UPLOADS_COLLECTION].create_indexes([
+        IndexModel([("file_id", ASCENDING)], name="file_id"),
+        IndexModel([("user_id", ASCENDING), ("file_id", ASCENDING)], name="user_file")
+    ])
+
+# Helper functions for the collection catalog
+async def refresh_collection_catalog() -> set:
+    """Reload collection names from MongoDB into the in-process catalog"""
+    names = await db.list_collection_names()
+    collection_catalog["names"] = set(names)
+    # Statistics for dropped collections go with them
+    for dropped in [name for name in field_statistics if name not in collection_catalog["names"]]:
+        del field_statistics[dropped]
+    collection_catalog["refreshed_at"] = datetime.utcnow()
+    return collection_catalog["names"]
+
+async def get_collection_names() -> set:
+    """Get known collection names, refreshing the catalog only when it is empty or stale"""
+    refreshed_at = collection_catalog["refreshed_at"]
+    if refreshed_at is None or datetime.utcnow() - refreshed_at > timedelta(seconds=CATALOG_TTL_SECONDS):
+        try:
+            await refresh_collection_catalog()
+        except Exception as e:
+            logging.error(f"Collection catalog refresh error: {e}")
+    return collection_catalog["names"]
+
+async def collection_exists(collection_name: str) -> bool:
+    """Validate a collection name against the catalog (a set lookup, no server round trip)"""
+    return collection_name in await get_collection_names()
+
+# Helper functions for request coalescing
+def single_flight_key(*parts: Any) -> str:
+    """Build a stable key for a call from its arguments"""
+    return json.dumps(parts, sort_keys=True, default=str)
+
+async def single_flight(key: str, factory):
+    """Run factory() at most once per key at a time; concurrent identical calls await the same task"""
+    task = inflight_calls.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        inflight_calls[key] = task
+        
+        def release(finished_task, key=key):
+            if inflight_calls.get(key) is finished_task:
+                del inflight_calls[key]
+        
+        task.add_done_callback(release)
+    # Shield so one caller disconnecting does not cancel the work others are waiting on
+    return await asyncio.shield(task)
+
+# Helper functions for background tasks
+def run_in_background(coro, description: str) -> asyncio.Task:
+    """Start a task nobody awaits, keeping a reference until it finishes and logging how it failed"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    
+    def finished(done_task: asyncio.Task):
+        background_tasks.discard(done_task)
+        if not done_task.cancelled() and done_task.exception() is not None:
+            logging.error(f"Background task {description} failed: {done_task.exception()!r}")
+    
+    task.add_done_callback(finished)
+    return task
+
+# Helper functions for data versions and the result cache
+def bump_data_version(collection_name: str):
+    """Mark a collection's data as changed so cached results built from it are discarded"""
+    collection_data_versions[collection_name] += 1
+    data_version_changed_at[collection_name] = datetime.utcnow()
+
+async def publish_data_change(collection_name: str):
+    """Bump a collection's data version here and in the shared version document other processes follow"""
+    bump_data_version(collection_name)
+    seen = data_version_watch["seen"]
+    try:
+        doc = await db[DATA_VERSIONS_COLLECTION].find_one_and_update(
+            {"_id": collection_name},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow(), "origin": PROCESS_ID}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        previous = seen.get(collection_name)
+        if previous is not None and doc["version"] > previous + 1:
+            # Another process published since we last looked; its event will now be skipped as already seen
+            bump_data_version(collection_name)
+        seen[collection_name] = max(doc["version"], previous or 0)
+    except Exception as e:
+        logging.error(f"Data version publish error for {collection_name}: {e}")
+
+def apply_published_version(doc: Optional[Dict[str, Any]], record_only: bool = False) -> bool:
+    """Bump the local data version for a published version document, skipping this process's own and already seen versions"""
+    if not doc or doc.get("version") is None:
+        return False
+    collection_name = doc["_id"]
+    seen = data_version_watch["seen"]
+    if collection_name in seen and doc["version"] <= seen[collection_name]:
+        return False
+    seen[collection_name] = doc["version"]
+    if record_only or doc.get("origin") == PROCESS_ID or is_internal_collection(collection_name):
+        return False
+    bump_data_version(collection_name)
+    return True
+
+async def poll_data_versions():
+    """Bump local data versions whenever a shared version document moves"""
+    data_version_watch["mode"] = "polling"
+    first_poll = True
+    while True:
+        try:
+            async for doc in db[DATA_VERSIONS_COLLECTION].find({}):
+                # The first poll only learns the current versions
+                apply_published_version(doc, record_only=first_poll)
+            first_poll = False
+        except Exception as e:
+            logging.error(f"Data version poll error: {e}")
+        await asyncio.sleep(DATA_VERSION_POLL_SECONDS)
+
+async def watch_data_changes():
+    """Bump data versions from a change stream on the version documents, falling back to polling on standalone servers"""
+    while True:
+        try:
+            async with db[DATA_VERSIONS_COLLECTION].watch(full_document="updateLookup") as stream:
+                data_version_watch["mode"] = "change_stream"
+                async for change in stream:
+                    apply_published_version(change.get("fullDocument"))
+        except OperationFailure as e:
+            # Change streams need a replica set or sharded cluster
+            logging.info(f"Change streams unavailable ({e}), polling {DATA_VERSIONS_COLLECTION} instead")
+            await poll_data_versions()
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Change stream error, reconnecting: {e}")
+            await asyncio.sleep(DATA_VERSION_POLL_SECONDS)
+
+def result_cache_key(endpoint: str, filter_request: FilterRequest) -> str:
+    """Canonical hash of a FilterRequest so equivalent requests share one cache entry"""
+    canonical = {
+        "endpoint": endpoint,
+        "collection": filter_request.collection,
+        "states": sorted(filter_request.states) if filter_request.states else None,
+        "years": sorted(filter_request.years) if filter_request.years else None,
+        "crime_types": sorted(filter_request.crime_types) if filter_request.crime_types else None,
+        "sort": resolve_sort_criteria(filter_request),
+        "page_token": filter_request.page_token,
+        "limit": filter_request.limit or 100,
+        "chart_type": filter_request.chart_type or "bar"
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+def result_cache_get(key: str, collection_name: str) -> Optional[Dict[str, Any]]:
+    """Get a cached result if it is neither expired nor built from an older data version"""
+    entry = result_cache.get(key)
+    if entry is not None:
+        if entry["expires"] < datetime.utcnow():
+            result_cache_stats["expired"] += 1
+            result_cache_evict(key)
+        elif entry["version"] != collection_data_versions[collection_name]:
+            result_cache_stats["invalidated"] += 1
+            result_cache_evict(key)
+        else:
+            result_cache.move_to_end(key)
+            result_cache_stats["hits"] += 1
+            return entry["value"]
+    result_cache_stats["misses"] += 1
+    return None
+
+def result_cache_put(key: str, collection_name: str, value: Dict[str, Any], version: Optional[int] = None):
+    """Store a result under the data version it was read at, evicting least recently used entries beyond the entry and memory caps"""
+    size = len(json.dumps(value, default=str))
+    if size > RESULT_CACHE_MAX_BYTES:
+        return
+    result_cache_evict(key)
+    result_cache[key] = {
+        "value": value,
+        "size": size,
+        "version": collection_data_versions[collection_name] if version is None else version,
+        "expires": datetime.utcnow() + timedelta(seconds=RESULT_CACHE_TTL_SECONDS)
+    }
+    result_cache_stats["bytes"] += size
+    while len(result_cache) > RESULT_CACHE_MAX_ENTRIES or result_cache_stats["bytes"] > RESULT_CACHE_MAX_BYTES:
+        oldest_key = next(iter(result_cache))
+        result_cache_evict(oldest_key)
+        result_cache_stats["evictions"] += 1
+
+def result_cache_evict(key: str):
+    """Remove one entry from the result cache"""
+    entry = result_cache.pop(key, None)
+    if entry is not None:
+        result_cache_stats["bytes"] -= entry["size"]
+
+# Helper functions for the in-memory public data store
+def build_columns(docs: List[Dict]) -> Dict[str, Any]:
+    """Convert a list of documents into typed NumPy column arrays with per-field presence masks"""
+    fields = []
+    seen = set()
+    for doc in docs:
+        for key in doc:
+            if key not in seen:
+                seen.add(key)
+                fields.append(key)
+    
+    columns = {}
+    present = {}
+    integral = {}  # float columns mixing ints and floats remember which rows held ints
+    for field in fields:
+        mask = np.fromiter((field in doc for doc in docs), dtype=bool, count=len(docs))
+        values = [doc.get(field) for doc in docs]
+        all_present = bool(mask.all())
+        present_values = values if all_present else [value for value, has in zip(values, mask) if has]
+        # Decide the column type from the handful of distinct Python types rather than per value
+        value_types = set(map(type, present_values))
+        
+        if present_values and all(issubclass(t, int) and not issubclass(t, bool) for t in value_types):
+            column = np.array(values if all_present else [v if has else 0 for v, has in zip(values, mask)], dtype=np.int64)
+        elif present_values and all(issubclass(t, (int, float)) and not issubclass(t, bool) for t in value_types):
+            column = np.array([v if has else np.nan for v, has in zip(values, mask)], dtype=np.float64)
+            integral[field] = np.fromiter((isinstance(v, int) for v in values), dtype=bool, count=len(docs))
+        else:
+            column = np.empty(len(docs), dtype=object)
+            if any(issubclass(t, datetime) for t in value_types):
+                column[:] = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+            else:
+                column[:] = values
+        
+        columns[field] = column
+        present[field] = mask
+    
+    return {"fields": fields, "columns": columns, "present": present, "integral": integral, "length": len(docs)}
+
+def build_value_masks(column: np.ndarray, present: np.ndarray) -> Optional[Dict[Any, np.ndarray]]:
+    """Precompute one boolean mask per distinct value of a low-cardinality column"""
+    try:
+        values = set(column[present].tolist())
+    except TypeError:
+        return None  # unhashable values, evaluate on the fly instead
+    return {value: (column == value) & present for value in values}
+
+def build_public_snapshot(docs: List[Dict]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Build a collection's columnar snapshot and its field statistics (CPU-bound, so it runs in a worker thread)"""
+    snapshot = build_columns(docs)
+    snapshot["masks"] = {
+        field: build_value_masks(snapshot["columns"][field], snapshot["present"][field])
+        for field in PUBLIC_STORE_MASK_FIELDS if field in snapshot["columns"]
+    }
+    snapshot["fingerprint"] = hashlib.sha1(json.dumps(docs, sort_keys=True, default=str).encode()).hexdigest()
+    return snapshot, compute_field_statistics(snapshot)
+
+async def load_public_collection(collection_name: str) -> Optional[Dict[str, Any]]:
+    """Load one public collection from MongoDB into a columnar snapshot"""
+    try:
+        # A version bump during the load leaves this snapshot stale, so the next lookup reloads it
+        version = collection_data_versions[collection_name]
+        docs = await read_collection(collection_name, "analytics").find({}, {"_id": 0}).to_list(None)
+        # Building takes seconds on large collections; off the event loop, requests keep being served meanwhile
+        snapshot, fields = await asyncio.to_thread(build_public_snapshot, docs)
+        snapshot["loaded_at"] = datetime.utcnow()
+        
+        previous = public_data_store.get(collection_name)
+        if previous is not None and previous["fingerprint"] != snapshot["fingerprint"]:
+            # Announce changes nobody published (direct writes); a reload after a version bump already has one
+            if previous["version"] == version:
+                unchanged_during_load = version == collection_data_versions[collection_name]
+                await publish_data_change(collection_name)
+                if unchanged_during_load:
+                    version = collection_data_versions[collection_name]
+            if collection_name in ROLLUP_CUBES:
+                run_in_background(build_rollup_cube(collection_name), f"rollup cube for {collection_name}")
+            if collection_name in TIME_BUCKET_ROLLUPS:
+                run_in_background(build_time_bucket_rollups(collection_name), f"time buckets for {collection_name}")
+        snapshot["version"] = version
+        public_data_store[collection_name] = snapshot
+        # Stamped with the version the rows were read at, so a bump during the load leaves them unused
+        store_field_statistics(collection_name, version, snapshot, fields=fields)
+        registered = dataset_registry.get(collection_name)
+        if registered is None or registered.get("fingerprint") != snapshot["fingerprint"]:
+            await update_dataset_registry(collection_name, snapshot["length"], snapshot["fingerprint"])
+        return snapshot
+    except Exception as e:
+        logging.error(f"Public store load error for {collection_name}: {e}")
+        return None
+    finally:
+        public_store_refreshing.discard(collection_name)
+
+async def load_public_store():
+    """Load every public collection into memory concurrently"""
+    await asyncio.gather(*(load_public_collection(name) for name in PUBLIC_COLLECTIONS))
+
+def get_public_snapshot(collection_name: str) -> Optional[Dict[str, Any]]:
+    """Get the in-memory snapshot for a public collection, scheduling a background refresh when stale (None after a data version bump)"""
+    if collection_name not in PUBLIC_COLLECTIONS:
+        return None
+    snapshot = public_data_store.get(collection_name)
+    outdated = snapshot is not None and snapshot["version"] != collection_data_versions[collection_name]
+    is_stale = snapshot is None or outdated or datetime.utcnow() - snapshot["loaded_at"] > timedelta(seconds=PUBLIC_STORE_TTL_SECONDS)
+    if is_stale and collection_name not in public_store_refreshing:
+        public_store_refreshing.add(collection_name)
+        run_in_background(load_public_collection(collection_name), f"public store load for {collection_name}")
+    return None if outdated else snapshot
+
+def match_values_mask(snapshot: Dict[str, Any], field: str, values: List[Any]) -> Optional[np.ndarray]:
+    """Boolean mask of rows whose field equals any of the given values"""
+    length = snapshot["length"]
+    if any(value is None or isinstance(value, (dict, list)) for value in values):
+        return None  # null/document matching semantics are left to MongoDB
+    if field not in snapshot["columns"]:
+        return np.zeros(length, dtype=bool)
+    
+    value_masks = snapshot["masks"].get(field)
+    column = snapshot["columns"][field]
+    present = snapshot["present"][field]
+    mask = np.zeros(length, dtype=bool)
+    for value in values:
+        if value_masks is not None:
+            value_mask = value_masks.get(value)
+            if value_mask is not None:
+                mask |= value_mask
+        elif column.dtype != object:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                mask |= (column == value) & present
+        else:
+            mask |= np.array([item == value for item in column], dtype=bool) & present
+    return mask
+
+def select_public_rows(snapshot: Dict[str, Any], query: Dict[str, Any]) -> Optional[np.ndarray]:
+    """Evaluate the simple filter shapes built by this API against a snapshot; None when unsupported"""
+    selected = np.ones(snapshot["length"], dtype=bool)
+    range_ops = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+    
+    for field, condition in query.items():
+        if field.startswith('$'):
+            return None
+        if not isinstance(condition, dict):
+            condition = {"$in": [condition]}
+        for op, operand in condition.items():
+            if op == "$in":
+                mask = match_values_mask(snapshot, field, list(operand))
+            elif op in range_ops:
+                column = snapshot["columns"].get(field)
+                if column is None:
+                    mask = np.zeros(snapshot["length"], dtype=bool)
+                elif column.dtype == object or not isinstance(operand, (int, float)):
+                    return None
+                else:
+                    mask = range_ops[op](column, operand) & snapshot["present"][field]
+            else:
+                return None
+            if mask is None:
+                return None
+            selected &= mask
+    return selected
+
+def sort_public_rows(snapshot: Dict[str, Any], indices: np.ndarray, sort_criteria: List[tuple]) -> Optional[np.ndarray]:
+    """Order selected row indices like MongoDB would (missing values first when ascending)"""
+    if not sort_criteria:
+        return indices
+    if len(sort_criteria) > 1:
+        return None
+    field, direction = sort_criteria[0]
+    if field not in snapshot["columns"]:
+        return indices
+    
+    column = snapshot["columns"][field][indices]
+    present = snapshot["present"][field][indices]
+    if column.dtype == object:
+        if not all(isinstance(value, str) for value in column[present]):
+            return None
+        column = np.array([value if has else '' for value, has in zip(column, present)])
+    order = np.lexsort((column, present))
+    if direction == -1:
+        order = order[::-1]
+    return indices[order]
+
+def render_public_rows(snapshot: Dict[str, Any], indices: np.ndarray) -> List[Dict]:
+    """Rebuild plain documents for the given row indices"""
+    rows = [{} for _ in range(len(indices))]
+    for field in snapshot["fields"]:
+        values = snapshot["columns"][field][indices].tolist()
+        present = snapshot["present"][field][indices].tolist()
+        if field in snapshot["integral"]:
+            integral = snapshot["integral"][field][indices].tolist()
+            values = [int(value) if is_int else value for value, is_int in zip(values, integral)]
+        for row, value, has in zip(rows, values, present):
+            if has:
+                row[field] = value
+    return rows
+
+def find_in_public_store(collection_name: str, query: Dict[str, Any], sort_criteria: List[tuple] = None, limit: int = 100) -> Optional[Tuple[List[Dict], int]]:
+    """Answer a find from memory, returning (documents, total matching count) or None to fall back to MongoDB"""
+    snapshot = get_public_snapshot(collection_name)
+    if snapshot is None:
+        return None
+    try:
+        selected = select_public_rows(snapshot, query)
+        if selected is None:
+            return None
+        indices = np.flatnonzero(selected)
+        ordered = sort_public_rows(snapshot, indices, sort_criteria or [])
+        if ordered is None:
+            return None
+        return render_public_rows(snapshot, ordered[:limit]), len(indices)
+    except Exception as e:
+        logging.error(f"Public store query error for {collection_name}: {e}")
+        return None
+
+async def find_documents(collection_name: str, query: Dict[str, Any], sort_criteria: List[tuple] = None, limit: int = 100, debug: Optional[Dict[str, Any]] = None, profile: str = "analytics") -> List[Dict]:
+    """Find documents, served from the in-memory store for public collections when possible"""
+    served = find_in_public_store(collection_name, query, sort_criteria, limit)
+    if debug is not None:
+        debug["find_source"] = "memory" if served is not None else "mongo"
+    if served is not None:
+        return served[0]
+    
+    async def run_find():
+        cursor = read_collection(collection_name, profile).find(query)
+        if sort_criteria:
+            cursor = cursor.sort(sort_criteria)
+        return await cursor.limit(limit).to_list(limit)
+    
+    return await single_flight(single_flight_key("find", collection_name, query, sort_criteria, limit, profile), run_find)
+
+async def count_matching_documents(collection_name: str, query: Dict[str, Any], debug: Optional[Dict[str, Any]] = None, profile: str = "analytics") -> int:
+    """Count matching documents, served from the in-memory store for public collections when possible"""
+    snapshot = get_public_snapshot(collection_name)
+    if snapshot is not None:
+        try:
+            selected = select_public_rows(snapshot, query)
+            if selected is not None:
+                if debug is not None:
+                    debug["count_source"] = "memory"
+                return int(selected.sum())
+        except Exception as e:
+            logging.error(f"Public store count error for {collection_name}: {e}")
+    if debug is not None:
+        debug["count_source"] = "mongo"
+    return await single_flight(
+        single_flight_key("count", collection_name, query, profile),
+        lambda: read_collection(collection_name, profile).count_documents(query)
+    )
+
+# Helper functions for field statistics
+DATE_STRING_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+def describe_column(column: np.ndarray, present: np.ndarray, length: int) -> Dict[str, Any]:
+    """Distinct count, null ratio and value histogram for one column"""
+    if column.dtype.kind in "if":
+        valid = present & ~np.isnan(column) if column.dtype.kind == "f" else present
+        values = column[valid]
+        stats = {"kind": "numeric", "non_null": int(valid.sum())}
+        stats["null_ratio"] = round(1 - stats["non_null"] / length, 4) if length else 0.0
+        if values.size == 0:
+            return {**stats, "distinct": 0, "histogram": []}
+        distinct = np.unique(values)
+        counts, edges = np.histogram(values, bins=min(FIELD_STATS_BINS, distinct.size))
+        stats.update({
+            "distinct": int(distinct.size),
+            "min": values.min().item(),
+            "max": values.max().item(),
+            "mean": round(float(values.mean()), 4),
+            "histogram": [
+                {"low": round(float(low), 4), "high": round(float(high), 4), "count": int(count)}
+                for low, high, count in zip(edges[:-1], edges[1:], counts)
+            ]
+        })
+        return stats
+    
+    values = [value for value, has in zip(column.tolist(), present) if has and value is not None]
+    stats = {"kind": "categorical", "non_null": len(values)}
+    stats["null_ratio"] = round(1 - len(values) / length, 4) if length else 0.0
+    try:
+        counter = Counter(values)
+    except TypeError:
+        counter = Counter(str(value) for value in values)  # lists or sub-documents
+    if values and all(isinstance(value, str) and DATE_STRING_PATTERN.match(value) for value in values[:100]):
+        stats["kind"] = "temporal"
+        stats["min"], stats["max"] = min(counter), max(counter)
+    stats["distinct"] = len(counter)
+    stats["histogram"] = [{"value": value, "count": count} for value, count in counter.most_common(FIELD_STATS_TOP_VALUES)]
+    stats["histogram_complete"] = len(counter) <= FIELD_STATS_TOP_VALUES
+    return stats
+
+def compute_field_statistics(snapshot: Dict[str, Any], exclude: tuple = ()) -> Dict[str, Dict[str, Any]]:
+    """Describe every field of a columnar snapshot"""
+    return {
+        field: describe_column(snapshot["columns"][field], snapshot["present"][field], snapshot["length"])
+        for field in snapshot["fields"] if field not in exclude
+    }
+
+def store_field_statistics(key: Any, version: int, snapshot: Dict[str, Any], exclude: tuple = (),
+                           fields: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Remember statistics for one collection or uploaded file (computed here unless given), keeping only the most recently used files"""
+    entry = {
+        "version": version,
+        "records": snapshot["length"],
+        "fields": compute_field_statistics(snapshot, exclude) if fields is None else fields,
+        "computed_at": datetime.utcnow()
+    }
+    if key in PUBLIC_COLLECTIONS:
+        field_statistics[key] = entry
+        return entry
+    upload_field_statistics[key] = entry
+    upload_field_statistics.move_to_end(key)
+    while len(upload_field_statistics) > FIELD_STATS_MAX_UPLOADS:
+        upload_field_statistics.popitem(last=False)
+    return entry
+
+def get_field_statistics(collection_name: str) -> Optional[Dict[str, Any]]:
+    """Statistics for a public collection, recomputed from its snapshot only after the data version moves"""
+    version = collection_data_versions[collection_name]
+    cached = field_statistics.get(collection_name)
+    if cached is not None and cached["version"] == version:
+        return cached
+    snapshot = get_public_snapshot(collection_name)
+    if snapshot is None:
+        return None
+    try:
+        return store_field_statistics(collection_name, snapshot["version"], snapshot)
+    except Exception as e:
+        logging.error(f"Field statistics error for {collection_name}: {e}")
+        return None
+
+async def get_file_field_statistics(rows, file_id: str) -> Dict[str, Any]:
+    """Statistics for one uploaded file; files never change, so each is described once while it stays in use"""
+    cached = upload_field_statistics.get(("upload", file_id))
+    if cached is not None:
+        upload_field_statistics.move_to_end(("upload", file_id))
+        return cached
+    docs = await rows.find(
+        {"file_id": file_id}, {"_id": 0, "file_id": 0, "user_id": 0, "filename": 0, "upload_date": 0}
+    ).to_list(None)
+    return store_field_statistics(("upload", file_id), 0, build_columns(docs))
+
+def rollup_worthwhile(collection_name: str, dimensions: List[str]) -> bool:
+    """Use a cube only when its cells are materially fewer than the raw rows"""
+    stats = field_statistics.get(collection_name)
+    if stats is None or not stats["records"]:
+        return True
+    cells = 1
+    for dimension in dimensions:
+        cells *= max(stats["fields"].get(dimension, {}).get("distinct", 1), 1)
+    return cells < stats["records"] * ROLLUP_MAX_CELL_RATIO
+
+# Helper functions for rollup cubes and aggregation
+def is_internal_collection(collection_name: str) -> bool:
+    """Check whether a collection is internal bookkeeping rather than a dataset"""
+    return collection_name.startswith(INTERNAL_COLLECTION_PREFIXES)
+
+def measure_name(field: str, func: str) -> str:
+    """Output field name for an aggregated measure ('*' counts rows)"""
+    return "count" if field == "*" else f"{field}_{func}"
+
+def aggregate_match(filters: Dict[str, Optional[List[Any]]]) -> Dict[str, Any]:
+    """Turn dimension filters (field -> allowed values) into a $match document"""
+    return {field: {"$in": values} for field, values in filters.items() if values}
+
+def aggregate_output(group_by: List[str], names: List[str]) -> Dict[str, Any]:
+    """Flatten grouped dimensions and measures into one output document"""
+    projection = {"_id": 0}
+    projection.update({dimension: f"$_id.{dimension}" for dimension in group_by})
+    projection.update({name: f"${name}" for name in names})
+    return projection
+
+async def build_rollup_cube(collection_name: str) -> bool:
+    """Rebuild one rollup cube collection from raw rows with $group and $merge"""
+    cube = ROLLUP_CUBES[collection_name]
+    cube_collection = f"{ROLLUP_COLLECTION_PREFIX}{collection_name}"
+    build_id = str(uuid.uuid4())
+    version = collection_data_versions[collection_name]
+    try:
+        group = {"_id": {dimension: f"${dimension}" for dimension in cube["dimensions"]}, "count": {"$sum": 1}}
+        for measure in cube["measures"]:
+            group[f"{measure}_sum"] = {"$sum": f"${measure}"}
+            group[f"{measure}_count"] = {"$sum": {"$cond": [{"$isNumber": f"${measure}"}, 1, 0]}}
+            group[f"{measure}_min"] = {"$min": f"${measure}"}
+            group[f"{measure}_max"] = {"$max": f"${measure}"}
+        
+        pipeline = [
+            {"$group": group},
+            {"$set": {**{dimension: f"$_id.{dimension}" for dimension in cube["dimensions"]}, "build_id": build_id}},
+            {"$merge": {"into": cube_collection, "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ]
+        await db[collection_name].aggregate(pipeline).to_list(None)
+        # Groups that no longer exist in the raw data were not touched by this build
+        await db[cube_collection].delete_many({"build_id": {"$ne": build_id}})
+        await db[cube_collection].create_index([(dimension, ASCENDING) for dimension in cube["dimensions"]], name="dimensions")
+        
+        rollup_cube_status[collection_name] = {"built_at": datetime.utcnow(), "version": version}
+        return True
+    except Exception as e:
+        logging.error(f"Rollup build error for {collection_name}: {e}")
+        return False
+
+async def build_rollup_cubes():
+    """Rebuild every rollup cube concurrently"""
+    await asyncio.gather(*(build_rollup_cube(name) for name in ROLLUP_CUBES))
+
+def rollup_cube_ready(collection_name: str) -> bool:
+    """A cube is usable only if it was built from the current data version"""
+    status = rollup_cube_status.get(collection_name)
+    return status is not None and status["version"] == collection_data_versions[collection_name]
+
+def rollup_can_answer(collection_name: str, filters: Dict[str, Any], group_by: List[str], measures: List[tuple]) -> bool:
+    """Check whether the cube's dimensions and measures cover an aggregate request"""
+    cube = ROLLUP_CUBES.get(collection_name)
+    if cube is None or not rollup_cube_ready(collection_name):
+        return False
+    if not rollup_worthwhile(collection_name, cube["dimensions"]):
+        return False
+    dimensions = set(cube["dimensions"])
+    filtered = {field for field, values in filters.items() if values}
+    if not filtered <= dimensions or not set(group_by) <= dimensions:
+        return False
+    return all(field == "*" or field in cube["measures"] for field, _ in measures)
+
+async def aggregate_from_rollup(collection_name: str, filters: Dict[str, Any], group_by: List[str], measures: List[tuple], profile: str = "analytics") -> List[Dict]:
+    """Re-group pre-aggregated cube cells; averages are recombined from sums and counts"""
+    group = {"_id": {dimension: f"${dimension}" for dimension in group_by}}
+    derived = {}
+    for field, func in measures:
+        name = measure_name(field, func)
+        if field == "*":
+            group[name] = {"$sum": "$count"}
+        elif func == "avg":
+            group[f"__sum_{field}"] = {"$sum": f"${field}_sum"}
+            group[f"__count_{field}"] = {"$sum": f"${field}_count"}
+            derived[name] = {"$cond": [
+                {"$gt": [f"$__count_{field}", 0]},
+                {"$divide": [f"$__sum_{field}", f"$__count_{field}"]},
+                None
+            ]}
+        elif func == "count":
+            group[name] = {"$sum": f"${field}_count"}
+        else:
+            group[name] = {f"${func}": f"${field}_{func}"}
+    
+    pipeline = [{"$match": aggregate_match(filters)}, {"$group": group}]
+    if derived:
+        pipeline.append({"$set": derived})
+    pipeline.append({"$project": aggregate_output(group_by, [measure_name(f, fn) for f, fn in measures])})
+    return await read_db(routed_read_profile(collection_name, profile))[f"{ROLLUP_COLLECTION_PREFIX}{collection_name}"].aggregate(pipeline).to_list(None)
+
+async def aggregate_from_raw(collection_name: str, filters: Dict[str, Any], group_by: List[str], measures: List[tuple], profile: str = "analytics") -> List[Dict]:
+    """Aggregate raw rows with a $group pipeline"""
+    group = {"_id": {dimension: f"${dimension}" for dimension in group_by}}
+    for field, func in measures:
+        name = measure_name(field, func)
+        if field == "*":
+            group[name] = {"$sum": 1}
+        elif func == "count":
+            group[name] = {"$sum": {"$cond": [{"$isNumber": f"${field}"}, 1, 0]}}
+        else:
+            group[name] = {f"${func}": f"${field}"}
+    
+    pipeline = [
+        {"$match": aggregate_match(filters)},
+        {"$group": group},
+        {"$project": aggregate_output(group_by, [measure_name(f, fn) for f, fn in measures])}
+    ]
+    return await read_collection(collection_name, profile).aggregate(pipeline).to_list(None)
+
+def aggregate_public_store(collection_name: str, filters: Dict[str, Any], group_by: List[str], measures: List[tuple]) -> Optional[List[Dict]]:
+    """Group and aggregate the in-memory snapshot; None when the request needs MongoDB"""
+    snapshot = get_public_snapshot(collection_name)
+    if snapshot is None:
+        return None
+    selected = select_public_rows(snapshot, aggregate_match(filters))
+    if selected is None:
+        return None
+    indices = np.flatnonzero(selected)
+    if len(indices) == 0:
+        return []
+    
+    # Factorize the group keys (missing values group together as null, like $group)
+    key_columns = []
+    for dimension in group_by:
+        if dimension in snapshot["columns"]:
+            values = snapshot["columns"][dimension][indices].tolist()
+            present = snapshot["present"][dimension][indices].tolist()
+            key_columns.append([value if has else None for value, has in zip(values, present)])
+        else:
+            key_columns.append([None] * len(indices))
+    group_ids = {}
+    keys = list(zip(*key_columns)) if key_columns else [()] * len(indices)
+    codes = np.fromiter((group_ids.setdefault(key, len(group_ids)) for key in keys), dtype=np.int64, count=len(indices))
+    group_count = len(group_ids)
+    
+    results = {}
+    for field, func in measures:
+        name = measure_name(field, func)
+        if field == "*":
+            results[name] = np.bincount(codes, minlength=group_count).tolist()
+            continue
+        column = snapshot["columns"].get(field)
+        if column is None:
+            results[name] = [0 if func in ("sum", "count") else None] * group_count
+            continue
+        if column.dtype == object:
+            return None  # non-numeric measure semantics are left to MongoDB
+        
+        valid = snapshot["present"][field][indices]
+        values = column[indices]
+        counts = np.bincount(codes[valid], minlength=group_count)
+        if func == "count":
+            results[name] = counts.tolist()
+        elif func in ("sum", "avg"):
+            sums = np.bincount(codes[valid], weights=values[valid].astype(np.float64), minlength=group_count)
+            if func == "sum":
+                results[name] = sums.astype(np.int64).tolist() if column.dtype == np.int64 else sums.tolist()
+            else:
+                results[name] = [total / count if count else None for total, count in zip(sums.tolist(), counts.tolist())]
+        elif func in ("min", "max"):
+            extreme = np.full(group_count, np.inf if func == "min" else -np.inf)
+            (np.minimum if func == "min" else np.maximum).at(extreme, codes[valid], values[valid])
+            cast = int if column.dtype == np.int64 else float
+            results[name] = [cast(value) if count else None for value, count in zip(extreme.tolist(), counts.tolist())]
+        else:
+            return None
+    
+    rows = []
+    for key, group_id in group_ids.items():
+        row = dict(zip(group_by, key))
+        for name, values in results.items():
+            row[name] = values[group_id]
+        rows.append(row)
+    return rows
+
+async def run_aggregate(collection_name: str, filters: Dict[str, Any], group_by: List[str], measures: List[tuple], profile: str = "analytics") -> Tuple[List[Dict], str]:
+    """Run an aggregate from the rollup cube when it covers the request, else from memory, else raw rows"""
+    if rollup_can_answer(collection_name, filters, group_by, measures):
+        try:
+            return await aggregate_from_rollup(collection_name, filters, group_by, measures, profile), "rollup"
+        except Exception as e:
+            logging.error(f"Rollup query error for {collection_name}: {e}")
+    try:
+        rows = aggregate_public_store(collection_name, filters, group_by, measures)
+        if rows is not None:
+            return rows, "memory"
+    except Exception as e:
+        logging.error(f"Public store aggregate error for {collection_name}: {e}")
+    return await aggregate_from_raw(collection_name, filters, group_by, measures, profile), "raw"
+
+async def get_measure_summary(collection_name: str, filters: Dict[str, Any], breakdown_by: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Summarize a collection's primary measure over the full filtered set, optionally broken down by one dimension"""
+    cube = ROLLUP_CUBES.get(collection_name)
+    if cube is None or collection_name not in MEASURE_SUMMARY_COLLECTIONS:
+        return None  # nothing renders a summary for this collection
+    measure = cube["measures"][0]
+    measures = [("*", "count")] + [(measure, func) for func in AGGREGATE_FUNCTIONS]
+    try:
+        totals_task = run_aggregate(collection_name, filters, [], measures)
+        if breakdown_by:
+            (totals, _), (groups, _) = await asyncio.gather(
+                totals_task, run_aggregate(collection_name, filters, [breakdown_by], [(measure, "sum")])
+            )
+        else:
+            totals, _ = await totals_task
+            groups = []
+        if not totals:
+            return None
+        row = totals[0]
+        return {
+            "summary": {
+                "records": row["count"],
+                "count": row[f"{measure}_count"],
+                "sum": row[f"{measure}_sum"],
+                "avg": row[f"{measure}_avg"],
+                "min": row[f"{measure}_min"],
+                "max": row[f"{measure}_max"]
+            },
+            "breakdown": {group.get(breakdown_by) or 'Unknown': group[f"{measure}_sum"] for group in groups}
+        }
+    except Exception as e:
+        logging.error(f"Measure summary error for {collection_name}: {e}")
+        return None
+
+def pivot_aggregate_rows(rows: List[Dict], dimensions: List[str], pivot: str, names: List[str]) -> Dict[str, Any]:
+    """Pivot long aggregate rows so the pivot dimension's values become columns"""
+    columns = sorted({row.get(pivot) for row in rows}, key=lambda value: (value is None, str(value)))
+    position = {value: index for index, value in enumerate(columns)}
+    index_dimensions = [dimension for dimension in dimensions if dimension != pivot]
+    
+    pivoted = {}
+    for row in rows:
+        key = tuple(row.get(dimension) for dimension in index_dimensions)
+        if key not in pivoted:
+            pivoted[key] = {
+                **dict(zip(index_dimensions, key)),
+                "values": {name: [None] * len(columns) for name in names}
+            }
+        for name in names:
+            pivoted[key]["values"][name][position[row.get(pivot)]] = row.get(name)
+    
+    return {"pivot": pivot, "columns": columns, "rows": list(pivoted.values())}
+
+# Helper functions for time-bucket rollups
+def time_bucket_collection(collection_name: str, granularity: str) -> str:
+    """Name of the rollup collection holding one granularity"""
+    return f"{ROLLUP_COLLECTION_PREFIX}{collection_name}_{granularity}"
+
+def time_bucket_start(day: str, granularity: str) -> str:
+    """First day (Monday or the 1st) of the bucket containing a 'YYYY-MM-DD' day"""
+    parsed = datetime.strptime(day, "%Y-%m-%d")
+    if granularity == "week":
+        parsed -= timedelta(days=parsed.weekday())
+    else:
+        parsed = parsed.replace(day=1)
+    return parsed.strftime("%Y-%m-%d")
+
+async def time_bucket_watermarks(bucket_collection: str, dimensions: List[str]) -> List[Tuple[Dict[str, Any], str]]:
+    """Latest merged day per dimension value (each state has its own), read back from a bucket collection"""
+    rows = await db[bucket_collection].aggregate([
+        {"$group": {"_id": {dimension: f"${dimension}" for dimension in dimensions}, "last_date": {"$max": "$last_date"}}}
+    ]).to_list(None)
+    # A dimension missing from the buckets was null in the rows; {field: None} matches both
+    return [({dimension: row["_id"].get(dimension) for dimension in dimensions}, row["last_date"]) for row in rows]
+
+def new_days_query(date_field: str, watermarks: List[Tuple[Dict[str, Any], str]]) -> Dict[str, Any]:
+    """Match days newer than their own state's watermark, plus every day of states with no buckets yet"""
+    if not watermarks:
+        return {date_field: {"$type": "string"}}
+    clauses = [{**key, date_field: {"$gt": last_date, "$type": "string"}} for key, last_date in watermarks]
+    clauses.append({date_field: {"$type": "string"}, "$nor": [key for key, _ in watermarks]})
+    return {"$or": clauses}
+
+async def build_time_bucket_rollup(collection_name: str, granularity: str) -> int:
+    """Re-aggregate the buckets touched by days newer than their state's watermark and $merge them into the rollup"""
+    config = TIME_BUCKET_ROLLUPS[collection_name]
+    date_field = config["date_field"]
+    bucket_collection = time_bucket_collection(collection_name, granularity)
+    
+    # Watermarks are per state: one state reporting late must not hide its days behind another's newer ones
+    watermarks = await time_bucket_watermarks(bucket_collection, config["dimensions"])
+    first_new = await db[collection_name].find_one(new_days_query(date_field, watermarks), {date_field: 1}, sort=[(date_field, 1)])
+    if first_new is None:
+        time_bucket_status[collection_name][granularity] = {"built_at": datetime.utcnow()}
+        return 0
+    
+    # Days arrive in order within a state, so only buckets from the earliest new day (of any state) onwards can change;
+    # every state is re-aggregated from there, which leaves the buckets of states without new days unchanged
+    since = time_bucket_start(first_new[date_field], granularity)
+    day = {"$dateFromString": {"dateString": f"${date_field}", "format": "%Y-%m-%d", "onError": None, "onNull": None}}
+    bucket_key = {dimension: f"${dimension}" for dimension in config["dimensions"]}
+    bucket_key["period_start"] = {"$dateTrunc": {"date": "$__day", "unit": granularity, "startOfWeek": "monday"}}
+    group = {
+        "_id": bucket_key,
+        "days": {"$sum": 1},
+        "first_date": {"$min": f"${date_field}"},
+        "last_date": {"$max": f"${date_field}"},
+    }
+    for measure in config["measures"]:
+        group[f"{measure}_sum"] = {"$sum": f"${measure}"}
+        group[f"{measure}_min"] = {"$min": f"${measure}"}
+        group[f"{measure}_max"] = {"$max": f"${measure}"}
+        group[f"{measure}_last"] = {"$last": f"${measure}"}
+    
+    pipeline = [
+        {"$match": {date_field: {"$gte": since, "$type": "string"}}},
+        {"$sort": {date_field: 1}},
+        {"$set": {"__day": day}},
+        {"$match": {"__day": {"$ne": None}}},
+        {"$group": group},
+        {"$set": {
+            **{dimension: f"$_id.{dimension}" for dimension in config["dimensions"]},
+            "granularity": granularity,
+            "year": {"$year": "$_id.period_start"},
+            "period_start": {"$dateToString": {"date": "$_id.period_start", "format": "%Y-%m-%d"}},
+            "period_end": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$dateSubtract": {
+                "startDate": {"$dateAdd": {"startDate": "$_id.period_start", "unit": granularity, "amount": 1}},
+                "unit": "day",
+                "amount": 1
+            }}}}
+        }},
+        {"$merge": {"into": bucket_collection, "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+    await db[collection_name].aggregate(pipeline).to_list(None)
+    await db[bucket_collection].create_index([("period_start", ASCENDING), ("state", ASCENDING)], name="period_state")
+    
+    time_bucket_status[collection_name][granularity] = {"built_at": datetime.utcnow()}
+    return await db[bucket_collection].count_documents({"last_date": {"$gte": since}})
+
+async def build_time_bucket_rollups(collection_name: Optional[str] = None):
+    """Extend every weekly/monthly rollup (or one collection's) with days added since the last build"""
+    names = [collection_name] if collection_name else list(TIME_BUCKET_ROLLUPS)
+    for name in names:
+        if name in time_bucket_building:
+            continue  # an earlier build is still merging
+        time_bucket_building.add(name)
+        try:
+            for granularity in TIME_BUCKET_GRANULARITIES:
+                updated = await build_time_bucket_rollup(name, granularity)
+                if updated:
+                    logging.info(f"Merged {updated} {granularity} buckets into {time_bucket_collection(name, granularity)}")
+        except Exception as e:
+            logging.error(f"Time-bucket rollup error for {name}: {e}")
+        finally:
+            time_bucket_building.discard(name)
+
+def choose_granularity(start_date: Optional[str], end_date: Optional[str]) -> str:
+    """Pick day, week or month resolution for a requested date span (open spans use months)"""
+    if not start_date or not end_date:
+        return "month"
+    span_days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days + 1
+    for max_span, granularity in TIME_BUCKET_AUTO_SPANS:
+        if span_days <= max_span:
+            return granularity
+    return "month"
+
+async def find_time_buckets(collection_name: str, granularity: str, states: Optional[List[str]], start_date: Optional[str], end_date: Optional[str], profile: str = "analytics") -> Optional[List[Dict]]:
+    """Read the buckets overlapping a date span, or None when that rollup has not been built yet"""
+    if granularity not in time_bucket_status.get(collection_name, {}):
+        return None
+    query = {}
+    if states:
+        query["state"] = {"$in": states}
+    if start_date:
+        query["period_end"] = {"$gte": start_date}
+    if end_date:
+        query["period_start"] = {"$lte": end_date}
+    cursor = read_db(routed_read_profile(collection_name, profile))[time_bucket_collection(collection_name, granularity)].find(query, {"_id": 0})
+    return await cursor.sort([("period_start", ASCENDING), ("state", ASCENDING)]).limit(TIME_BUCKET_MAX_ROWS).to_list(None)
+
+# Helper functions for derived date fields
+async def backfill_covid_date_fields() -> int:
+    """Backfill integer year/month on covid_stats documents that only carry a date string (newly loaded days included)"""
+    try:
+        split_date = {"$split": ["$date", "-"]}
+        result = await db["covid_stats"].update_many(
+            {"year": {"$exists": False}, "date": {"$type": "string"}},
+            [{"$set": {
+                "year": {"$convert": {"input": {"$arrayElemAt": [split_date, 0]}, "to": "int", "onError": None, "onNull": None}},
+                "month": {"$convert": {"input": {"$arrayElemAt": [split_date, 1]}, "to": "int", "onError": None, "onNull": None}}
+            }}]
+        )
+        if result.modified_count:
+            logging.info(f"Backfilled year/month on {result.modified_count} covid_stats documents")
+            await publish_data_change("covid_stats")
+        return result.modified_count
+    except Exception as e:
+        logging.error(f"covid_stats year backfill error: {e}")
+        return 0
+
+# Helper functions for the dataset registry
+def describe_dataset(collection_name: str) -> str:
+    """Human-readable description of a dataset from its collection name"""
+    description = "Dataset containing various data points"
+    if "covid" in collection_name.lower():
+        description = "COVID-19 statistics and trends data"
+    elif "crime" in collection_name.lower():
+        description = "Crime statistics and safety data"
+    elif "education" in collection_name.lower() or "literacy" in collection_name.lower():
+        description = "Education and literacy statistics"
+    elif "aqi" in collection_name.lower():
+        description = "Air Quality Index measurements"
+    return description
+
+async def load_dataset_registry():
+    """Load the persisted registry into memory"""
+    async for doc in db[DATASET_REGISTRY_COLLECTION].find({}):
+        dataset_registry[doc["_id"]] = doc
+
+async def update_dataset_registry(collection_name: str, record_count: Optional[int] = None, fingerprint: Optional[str] = None):
+    """Record that a collection's data changed now, at ingest or refresh time"""
+    if record_count is None:
+        record_count = await db[collection_name].count_documents({})
+    entry = {
+        "_id": collection_name,
+        "name": collection_name.replace('_', ' ').title(),
+        "description": describe_dataset(collection_name),
+        "record_count": record_count,
+        "last_updated": datetime.utcnow().replace(microsecond=0),
+        "fingerprint": fingerprint
+    }
+    dataset_registry[collection_name] = entry
+    try:
+        await db[DATASET_REGISTRY_COLLECTION].replace_one({"_id": collection_name}, entry, upsert=True)
+    except Exception as e:
+        logging.error(f"Dataset registry write error for {collection_name}: {e}")
+
+async def register_missing_datasets(collection_names: List[str]):
+    """Add registry entries for collections that were created outside the ingest paths"""
+    for collection_name in collection_names:
+        if collection_name not in dataset_registry:
+            await update_dataset_registry(collection_name)
+
+async def get_dataset_catalog() -> Dict[str, Any]:
+    """Rendered /api/datasets body with its validators, rebuilt only when the registry or catalog changes"""
+    names = sorted(name for name in await get_collection_names() if not is_internal_collection(name))
+    missing = [name for name in names if name not in dataset_registry]
+    if missing:
+        run_in_background(register_missing_datasets(missing), "dataset registration")
+    entries = [dataset_registry[name] for name in names if name in dataset_registry]
+    
+    key = single_flight_key([(entry["_id"], entry["record_count"], entry["last_updated"]) for entry in entries])
+    if dataset_catalog["key"] != key:
+        datasets = [
+            DatasetInfo(
+                name=entry["name"],
+                collection=entry["_id"],
+                description=entry["description"],
+                record_count=entry["record_count"],
+                last_updated=entry["last_updated"]
+            ).dict()
+            for entry in entries
+        ]
+        body = json.dumps(jsonable_encoder(datasets)).encode()
+        last_modified = max((entry["last_updated"] for entry in entries), default=datetime.utcnow())
+        dataset_catalog.update({
+            "key": key,
+            "body": body,
+            "etag": f'"{hashlib.sha1(body).hexdigest()}"',
+            "last_modified": last_modified.strftime("%a, %d %b %Y %H:%M:%S GMT")
+        })
+    return dataset_catalog
+
+async def warm_dataset_catalog():
+    """Register every listed collection and render the /api/datasets body"""
+    names = [name for name in await get_collection_names() if not is_internal_collection(name)]
+    await register_missing_datasets(names)
+    await get_dataset_catalog()
+
+# Helper functions for usage counters
+def count_usage(endpoint: str, dataset: Optional[str] = None):
+    """Count one request in memory; the scheduler flushes the deltas"""
+    usage_pending[(endpoint, dataset or "")] += 1
+
+async def load_usage_counters():
+    """Load flushed totals so counts survive restarts"""
+    async for doc in db[USAGE_COUNTERS_COLLECTION].find({}):
+        usage_totals[(doc["endpoint"], doc["dataset"])] = doc.get("count", 0)
+
+async def flush_usage_counters():
+    """Write the pending deltas with one unordered bulk of $inc upserts"""
+    if not usage_pending:
+        return
+    pending = list(usage_pending.items())
+    usage_pending.clear()
+    now = datetime.utcnow()
+    try:
+        await db[USAGE_COUNTERS_COLLECTION].bulk_write([
+            UpdateOne(
+                {"_id": f"{endpoint}:{dataset}"},
+                {"$inc": {"count": delta}, "$set": {"endpoint": endpoint, "dataset": dataset, "updated_at": now}},
+                upsert=True
+            )
+            for (endpoint, dataset), delta in pending
+        ], ordered=False)
+    except BulkWriteError as e:
+        # Unordered bulks apply every op that did not error, so only the failed deltas are kept for the next flush
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        for index, (key, delta) in enumerate(pending):
+            if index in failed:
+                usage_pending[key] += delta
+            else:
+                usage_totals[key] += delta
+        raise
+    except Exception:
+        # Nothing is known to have been written, so keep every delta for the next flush
+        for key, delta in pending:
+            usage_pending[key] += delta
+        raise
+    for key, delta in pending:
+        usage_totals[key] += delta
+
+def usage_summary() -> Dict[str, int]:
+    """Flushed plus pending counts per metric"""
+    summary = defaultdict(int)
+    for counts in (usage_totals, usage_pending):
+        for (endpoint, _), count in counts.items():
+            summary[USAGE_METRICS.get(endpoint, endpoint)] += count
+    return summary
+
+# Helper functions for platform stats
+async def refresh_platform_stats():
+    """Recompute the user and dataset counts behind /api/stats"""
+    collections = [name for name in await get_collection_names() if not is_internal_collection(name)]
+    total_users = await read_db("analytics")["users"].estimated_document_count()
+    platform_stats["snapshot"] = {"total_users": total_users, "total_datasets": len(collections)}
+    platform_stats["refreshed_at"] = datetime.utcnow()
+    return platform_stats["snapshot"]
+
+def current_platform_stats() -> StatsResponse:
+    """Merge the background snapshot with live usage counters"""
+    usage = usage_summary()
+    return StatsResponse(
+        total_visualizations=usage["visualizations"],
+        total_users=platform_stats["snapshot"]["total_users"],
+        total_datasets=platform_stats["snapshot"]["total_datasets"],
+        total_insights=usage["insights"]
+    )
+
+# Helper functions for startup warm-up
+async def warm_step(name: str, awaitable) -> bool:
+    """Run one warm-up step, recording its duration and any error"""
+    started = time.perf_counter()
+    try:
+        await awaitable
+        readiness["steps"][name] = {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 1)}
+        return True
+    except Exception as e:
+        logging.error(f"Warm-up step {name} failed: {e}")
+        readiness["steps"][name] = {"ok": False, "ms": round((time.perf_counter() - started) * 1000, 1), "error": str(e)}
+        return False
+
+async def warm_up():
+    """Prepare the data layer and preload caches, then mark the process ready"""
+    readiness["started_at"] = datetime.utcnow()
+    await warm_step("backfill", backfill_covid_date_fields())
+    await warm_step("indexes", ensure_indexes())
+    await warm_step("upload_indexes", ensure_upload_indexes())
+    await warm_step("dataset_registry", load_dataset_registry())
+    await warm_step("usage_counters", load_usage_counters())
+    await asyncio.gather(
+        warm_step("catalog", refresh_collection_catalog()),
+        warm_step("public_store", load_public_store())
+    )
+    await asyncio.gather(
+        *(warm_step(f"metadata:{name}", get_collection_metadata(name)) for name in PUBLIC_COLLECTIONS),
+        warm_step("datasets", warm_dataset_catalog()),
+        warm_step("platform_stats", refresh_platform_stats())
+    )
+    readiness["ready"] = True
+    readiness["warmed_at"] = datetime.utcnow()
+    logging.info(f"Warm-up finished in {(readiness['warmed_at'] - readiness['started_at']).total_seconds():.1f}s")
+    
+    # Aggregates fall back to raw rows until the rollups exist, so they build after readiness
+    await warm_step("rollup_cubes", build_rollup_cubes())
+    await warm_step("time_buckets", build_time_bucket_rollups())
+    await watch_data_changes()
+
+# Helper functions for the background job scheduler
+def schedule_job(name: str, interval_seconds: int, func):
+    """Register an async job to run every interval (with jitter) once the scheduler starts"""
+    scheduled_jobs[name] = {
+        "interval": interval_seconds,
+        "func": func,
+        "running": False,
+        "runs": 0,
+        "failures": 0,
+        "skipped": 0,
+        "last_started": None,
+        "last_ms": None,
+        "total_ms": 0.0,
+        "last_error": None
+    }
+
+async def run_scheduled_job(name: str):
+    """Run one job, skipping it while a previous run is still in progress"""
+    job = scheduled_jobs[name]
+    if job["running"]:
+        job["skipped"] += 1
+        return
+    job["running"] = True
+    job["last_started"] = datetime.utcnow()
+    started = time.perf_counter()
+    try:
+        await job["func"]()
+        job["last_error"] = None
+    except Exception as e:
+        job["failures"] += 1
+        job["last_error"] = str(e)
+        logging.error(f"Scheduled job {name} failed: {e}")
+    finally:
+        job["last_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        job["total_ms"] += job["last_ms"]
+        job["runs"] += 1
+        job["running"] = False
+
+async def scheduled_job_loop(name: str):
+    """Sleep a jittered interval, then run the job, forever"""
+    while True:
+        interval = scheduled_jobs[name]["interval"]
+        await asyncio.sleep(interval * random.uniform(1 - SCHEDULER_JITTER_RATIO, 1 + SCHEDULER_JITTER_RATIO))
+        await run_scheduled_job(name)
+
+def start_scheduler():
+    """Start one loop per registered job"""
+    for name in scheduled_jobs:
+        scheduler_tasks.append(asyncio.create_task(scheduled_job_loop(name)))
+
+def stop_scheduler():
+    """Cancel every job loop"""
+    for task in scheduler_tasks:
+        task.cancel()
+    scheduler_tasks.clear()
+
+async def sweep_expired_sessions():
+    """Drop expired captchas and sessions older than SESSION_TTL_HOURS"""
+    now = datetime.utcnow()
+    session_cutoff = now - timedelta(hours=SESSION_TTL_HOURS)
+    expired = [
+        key for key, value in list(active_sessions.items())
+        if (key.startswith("captcha_") and value.get("expires", now) < now)
+        or (not key.startswith("captcha_") and value.get("login_time", now) < session_cutoff)
+    ]
+    for key in expired:
+        active_sessions.pop(key, None)
+    if expired:
+        logging.info(f"Swept {len(expired)} expired captchas and sessions")
+
+async def sweep_result_cache():
+    """Evict expired result cache entries instead of waiting for a lookup to hit them"""
+    now = datetime.utcnow()
+    expired = [key for key, entry in list(result_cache.items()) if entry["expires"] < now]
+    for key in expired:
+        result_cache_evict(key)
+    result_cache_stats["expired"] += len(expired)
+
+async def refresh_public_store():
+    """Reload public collections that are not already being refreshed"""
+    names = [name for name in PUBLIC_COLLECTIONS if name not in public_store_refreshing]
+    public_store_refreshing.update(names)
+    await asyncio.gather(*(load_public_collection(name) for name in names))
+
+async def rebuild_stale_rollups():
+    """Rebuild rollup cubes whose data version moved since their last build"""
+    stale = [name for name in ROLLUP_CUBES if not rollup_cube_ready(name)]
+    await asyncio.gather(*(build_rollup_cube(name) for name in stale))
+
+def register_background_jobs():
+    """Declare the periodic jobs that keep caches, rollups and sessions fresh off the request path"""
+    schedule_job("usage_counters", USAGE_FLUSH_SECONDS, flush_usage_counters)
+    schedule_job("sweep_sessions", MAINTENANCE_INTERVAL_SECONDS, sweep_expired_sessions)
+    schedule_job("sweep_result_cache", MAINTENANCE_INTERVAL_SECONDS, sweep_result_cache)
+    schedule_job("collection_catalog", CATALOG_TTL_SECONDS, refresh_collection_catalog)
+    schedule_job("public_store", PUBLIC_STORE_TTL_SECONDS, refresh_public_store)
+    schedule_job("platform_stats", PLATFORM_STATS_REFRESH_SECONDS, refresh_platform_stats)
+    schedule_job("rollup_cubes", ROLLUP_REFRESH_SECONDS, rebuild_stale_rollups)
+    schedule_job("covid_date_fields", ROLLUP_REFRESH_SECONDS, backfill_covid_date_fields)
+    schedule_job("time_buckets", ROLLUP_REFRESH_SECONDS, build_time_bucket_rollups)
+
+# Helper functions for index management
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """Create every index declared in INDEX_REGISTRY (idempotent, safe to run on each startup), raising if any could not be created"""
+    created = {}
+    failures = []
+    for collection_name, indexes in INDEX_REGISTRY.items():
+        created[collection_name] = []
+        try:
+            existing = await db[collection_name].index_information()
+        except Exception as e:
+            logging.error(f"Could not list indexes on {collection_name}: {e}")
+            failures.append(f"{collection_name}: {e}")
+            continue
+        existing_keys = {name: [tuple(k) for k in info['key']] for name, info in existing.items()}
+        
+        for index_name, keys in indexes.items():
+            keys = [tuple(k) for k in keys]
+            try:
+                if existing_keys.get(index_name) not in (None, keys):
+                    # The declaration changed since the index was built (e.g. _id appended for keyset pagination)
+                    logging.warning(f"Recreating index {index_name} on {collection_name}: keys {existing_keys[index_name]} -> {keys}")
+                    await db[collection_name].drop_index(index_name)
+                elif index_name not in existing_keys and keys in existing_keys.values():
+                    # An equivalent index already exists under another name
+                    continue
+                await db[collection_name].create_indexes([IndexModel(keys, name=index_name)])
+                created[collection_name].append(index_name)
+            except Exception as e:
+                logging.error(f"Could not create index {index_name} on {collection_name}: {e}")
+                failures.append(f"{collection_name}.{index_name}: {e}")
+    if failures:
+        raise RuntimeError(f"Index creation failed for {'; '.join(failures)}")
+    return created
+
+async def get_index_report() -> Dict[str, Any]:
+    """Compare declared indexes with the live ones and report missing, undeclared and unused indexes"""
+    report = {}
+    for collection_name, indexes in INDEX_REGISTRY.items():
+        try:
+            existing = await db[collection_name].index_information()
+            existing_keys = {name: [tuple(k) for k in info['key']] for name, info in existing.items()}
+            declared_keys = {name: [tuple(k) for k in keys] for name, keys in indexes.items()}
+            
+            # Access counters reset on server restart, so "unused" means unused since then
+            usage = {}
+            async for stat in db[collection_name].aggregate([{"$indexStats": {}}]):
+                usage[stat['name']] = stat.get('accesses', {}).get('ops', 0)
+            
+            report[collection_name] = {
+                "missing": [name for name, keys in declared_keys.items() if keys not in existing_keys.values()],
+                "undeclared": [name for name, keys in existing_keys.items() if name != '_id_' and keys not in declared_keys.values()],
+                "unused": [name for name, ops in usage.items() if name != '_id_' and ops == 0],
+                "usage": usage
+            }
+        except Exception as e:
+            logging.error(f"Index report error for {collection_name}: {e}")
+            report[collection_name] = {"error": str(e)}
+    return report
+
+# Helper functions for index-backed sorting and keyset pagination
+def resolve_sort_criteria(filter_request: FilterRequest) -> List[tuple]:
+    """Turn the multi-key sort spec (or legacy sort_by/sort_order) into (field, direction) pairs"""
+    if filter_request.sort:
+        return [(spec.field, 1 if spec.order == "asc" else -1) for spec in filter_request.sort]
+    if filter_request.sort_by:
+        return [(filter_request.sort_by, 1 if filter_request.sort_order == "asc" else -1)]
+    return []
+
+def resolve_index_sort(collection_name: str, sort_criteria: List[tuple]) -> Optional[List[tuple]]:
+    """Find a registered index whose key prefix serves the sort; returns its full key pattern (ending in _id)"""
+    fields = [field for field, _ in sort_criteria]
+    directions = [direction for _, direction in sort_criteria]
+    for keys in INDEX_REGISTRY.get(collection_name, {}).values():
+        if [field for field, _ in keys[:len(fields)]] != fields:
+            continue
+        index_directions = [direction for _, direction in keys[:len(fields)]]
+        if directions == index_directions:
+            return list(keys)
+        if directions == [-direction for direction in index_directions]:
+            # An index can be walked backwards, which inverts every key
+            return [(field, -direction) for field, direction in keys]
+    return None
+
+def sortable_key_prefixes(collection_name: str) -> List[str]:
+    """Describe the sorts the index registry can serve, for error messages"""
+    return [", ".join(field for field, _ in keys if field != "_id") for keys in INDEX_REGISTRY.get(collection_name, {}).values()]
+
+def page_query_fingerprint(collection_name: str, query: Dict[str, Any], sort_pattern: List[tuple]) -> str:
+    """Hash binding a page token to the query and sort it was issued for"""
+    return hashlib.sha256(json_util.dumps([collection_name, query, sort_pattern], sort_keys=True).encode()).hexdigest()[:16]
+
+def encode_page_token(collection_name: str, query: Dict[str, Any], sort_pattern: List[tuple], last_doc: Dict[str, Any]) -> str:
+    """Encode the sort key values of the last returned document as an opaque token"""
+    payload = {
+        "f": page_query_fingerprint(collection_name, query, sort_pattern),
+        "v": [last_doc.get(field) for field, _ in sort_pattern]
+    }
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode()
+
+def decode_page_token(page_token: str, collection_name: str, query: Dict[str, Any], sort_pattern: List[tuple]) -> List[Any]:
+    """Decode a page token, rejecting tokens issued for a different query or sort"""
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(page_token.encode()).decode())
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid page token")
+    if payload.get("f") != page_query_fingerprint(collection_name, query, sort_pattern):
+        raise HTTPException(status_code=400, detail="Page token does not match this query")
+    return payload["v"]
+
+def keyset_condition(sort_pattern: List[tuple], last_values: List[Any]) -> Dict[str, Any]:
+    """Build the range condition selecting documents after last_values in sort order (nulls sort lowest)"""
+    clauses = []
+    for position, (field, direction) in enumerate(sort_pattern):
+        prefix = {name: value for (name, _), value in zip(sort_pattern[:position], last_values[:position])}
+        value = last_values[position]
+        if value is None:
+            if direction == 1:
+                clauses.append({**prefix, field: {"$ne": None}})
+        elif direction == 1:
+            clauses.append({**prefix, field: {"$gt": value}})
+        else:
+            clauses.append({**prefix, field: {"$lt": value}})
+            clauses.append({**prefix, field: None})
+    return {"$or": clauses}
+
+def build_page_query(collection_name: str, query: Dict[str, Any], sort_pattern: List[tuple], page_token: Optional[str]) -> Dict[str, Any]:
+    """Add the keyset range condition for a page token to the base query"""
+    if not page_token:
+        return query
+    last_values = decode_page_token(page_token, collection_name, query, sort_pattern)
+    condition = keyset_condition(sort_pattern, last_values)
+    return {"$and": [query, condition]} if query else condition
+
+async def find_page(collection_name: str, query: Dict[str, Any], sort_pattern: List[tuple], limit: int, page_token: Optional[str] = None, profile: str = "export") -> Tuple[List[Dict], Optional[str]]:
+    """Read one page as an indexed range scan, returning the documents and the next page token"""
+    page_query = build_page_query(collection_name, query, sort_pattern, page_token)
+    data = await read_collection(collection_name, profile).find(page_query).sort(sort_pattern).limit(limit).to_list(limit)
+    next_page_token = None
+    if len(data) == limit:
+        next_page_token = encode_page_token(collection_name, query, sort_pattern, data[-1])
+    return data, next_page_token
+
+# Helper functions for query debugging
+@contextmanager
+def debug_stage(debug: Optional[Dict[str, Any]], name: str):
+    """Time a stage into the debug collector; a no-op when debugging is off"""
+    if debug is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        debug["timings_ms"][name] = round((time.perf_counter() - start) * 1000, 3)
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce explain() output to the winning plan, indexes used and keys/docs examined"""
+    winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    plan = winning_plan.get("queryPlan", winning_plan)  # slot-based engine nests the plan
+    stats = explain.get("executionStats", {})
+    
+    stages = []
+    indexes = []
+    node = plan
+    while node:
+        stages.append(node.get("stage"))
+        if node.get("indexName"):
+            indexes.append(node["indexName"])
+        children = node.get("inputStages") or ([node["inputStage"]] if node.get("inputStage") else [])
+        node = children[0] if children else None
+    
+    return {
+        "winning_plan": " <- ".join(stage for stage in stages if stage),
+        "indexes_used": indexes,
+        "collection_scan": "COLLSCAN" in stages,
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis")
+    }
+
+async def explain_find(collection_name: str, query: Dict[str, Any], sort_criteria: List[tuple], limit: int, profile: str = "export") -> Dict[str, Any]:
+    """Explain a find the way MongoDB would execute it"""
+    try:
+        cursor = read_collection(collection_name, profile).find(query)
+        if sort_criteria:
+            cursor = cursor.sort(sort_criteria)
+        return summarize_explain(await cursor.limit(limit).explain())
+    except Exception as e:
+        return {"error": str(e)}
+
+async def explain_count(collection_name: str, query: Dict[str, Any], profile: str = "export") -> Dict[str, Any]:
+    """Explain a count with execution statistics"""
+    try:
+        explain = await db.command(
+            {"explain": {"count": collection_name, "query": query}, "verbosity": "executionStats"},
+            read_preference=read_db(routed_read_profile(collection_name, profile)).read_preference
+        )
+        return summarize_explain(explain)
+    except Exception as e:
+        return {"error": str(e)}
+
 # Helper functions for data processing
 async def get_collection_metadata(collection_name: str) -> CollectionMetadata:
-    """Get metadata about a collection including available filters"""
+    """Get metadata about a collection including available filters, cached until its data version changes"""
+    version = collection_data_versions[collection_name]
+    cached = metadata_cache.get(collection_name)
+    if cached is not None and cached["version"] == version:
+        return cached["metadata"]
+    
+    metadata = await single_flight(
+        single_flight_key("metadata", collection_name, version),
+        lambda: compute_collection_metadata(collection_name)
+    )
+    if metadata.available_fields:  # empty metadata means the computation failed, retry next time
+        metadata_cache[collection_name] = {"version": version, "metadata": metadata, "cached_at": datetime.utcnow()}
+    return metadata
+
+def schema_discovery_stages(sample_size: int = None) -> List[Dict[str, Any]]:
+    """Sample documents and group their key/value pairs into per-field counts, types and nulls"""
+    return [
+        {"$sample": {"size": sample_size or SCHEMA_SAMPLE_SIZE}},
+        {"$project": {"pairs": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": "$pairs"},
+        {"$group": {
+            "_id": "$pairs.k",
+            "count": {"$sum": 1},
+            "types": {"$addToSet": {"$type": "$pairs.v"}},
+            # pandas writes empty cells as NaN, which is as missing as null
+            "missing": {"$sum": {"$cond": [
+                {"$or": [{"$eq": [{"$type": "$pairs.v"}, "null"]}, {"$eq": ["$pairs.v", float("nan")]}]}, 1, 0
+            ]}}
+        }}
+    ]
+
+def summarize_schema(rows: List[Dict[str, Any]], exclude: tuple = ()) -> List[Dict[str, Any]]:
+    """Turn grouped schema rows into field descriptions with fill rates over the sampled documents"""
+    # Every document has an _id, so its count is the number of documents sampled
+    sampled = next((row["count"] for row in rows if row["_id"] == "_id"), 0)
+    schema = []
+    for row in sorted(rows, key=lambda row: row["_id"]):
+        if row["_id"] == "_id" or row["_id"] in exclude:
+            continue
+        schema.append({
+            "name": row["_id"],
+            "types": sorted(t for t in row["types"] if t != "null"),
+            "fill_rate": round((row["count"] - row["missing"]) / sampled, 4) if sampled else 0.0
+        })
+    return schema
+
+async def get_collection_schema(collection_name: str, match: Optional[Dict[str, Any]] = None, exclude: tuple = (), database=None) -> List[Dict[str, Any]]:
+    """Discover the field set of a collection (or the documents matching a filter), cached per data version"""
+    source = database if database is not None else read_db(routed_read_profile(collection_name, "analytics"))
+    cache_key = (source.name, collection_name, single_flight_key(match))
+    version = collection_data_versions[collection_name]
+    # Filtered schemas (one per uploaded file) are kept only while recently used
+    cache = upload_schema_cache if match else schema_cache
+    cached = cache.get(cache_key)
+    if cached is None or cached["version"] != version:
+        pipeline = ([{"$match": match}] if match else []) + schema_discovery_stages()
+        rows = await single_flight(
+            single_flight_key("schema", source.name, collection_name, match, version),
+            lambda: source[collection_name].aggregate(pipeline).to_list(None)
+        )
+        cached = {"version": version, "schema": rows}
+        cache[cache_key] = cached
+    if match:
+        upload_schema_cache.move_to_end(cache_key)
+        while len(upload_schema_cache) > FIELD_STATS_MAX_UPLOADS:
+            upload_schema_cache.popitem(last=False)
+    return summarize_schema(cached["schema"], exclude)
+
+def metadata_facets(collection_name: str) -> Dict[str, List[Dict[str, Any]]]:
+    """$facet branches collecting distinct states, years, special filter values and field names"""
+    def distinct_values(field: str) -> List[Dict[str, Any]]:
+        return [{"$group": {"_id": f"${field}"}}, {"$match": {"_id": {"$ne": None}}}, {"$sort": {"_id": 1}}]
+    
+    facets = {
+        "states": distinct_values("state"),
+        # covid_stats carries a materialized integer year field
+        "years": distinct_values("year"),
+        "schema": schema_discovery_stages(),
+    }
+    if collection_name == "crimes":
+        facets["crime_types"] = distinct_values("crime_type")
+    return facets
+
+async def compute_collection_metadata(collection_name: str) -> CollectionMetadata:
+    """Compute collection metadata with a single $facet aggregation"""
     try:
-        # Get available states
-        states = await db[collection_name].distinct("state")
-        states.sort()
-        
-        # Get available years
-        years = []
-        if collection_name == "covid_stats":
-            # For COVID data, extract years from date field
-            dates = await db[collection_name].distinct("date")
-            years = list(set([int(date[:4]) for date in dates if date and len(date) >= 4]))
-        else:
-            years = await db[collection_name].distinct("year")
-        years.sort()
+        result = await read_collection(collection_name, "analytics").aggregate(
+            [{"$facet": metadata_facets(collection_name)}]
+        ).to_list(1)
+        facets = result[0] if result else {}
         
-        # Get all field names
-        sample_doc = await db[collection_name].find_one()
-        fields = list(sample_doc.keys()) if sample_doc else []
-        fields = [f for f in fields if f != '_id']
+        states = [row["_id"] for row in facets.get("states", [])]
+        years = [row["_id"] for row in facets.get("years", [])]
+        field_schema = summarize_schema(facets.get("schema", []))
+        fields = [field["name"] for field in field_schema]
         
         # Get special filters based on collection
         special_filters = {}
-        if collection_name == "crimes":
-            crime_types = await db[collection_name].distinct("crime_type")
-            special_filters["crime_types"] = sorted(crime_types)
-        elif collection_name == "covid_stats":
-            # Could add more COVID-specific filters if needed
-            pass
+        if "crime_types" in facets:
+            special_filters["crime_types"] = [row["_id"] for row in facets["crime_types"]]
         
         return CollectionMetadata(
             collection=collection_name,
             available_states=states,
             available_years=years,
             available_fields=fields,
-            special_filters=special_filters
+            special_filters=special_filters,
+            field_schema=field_schema
         )
     except Exception as e:
         logging.error(f"Error getting metadata for {collection_name}: {e}")
@@ -269,29 +2066,187 @@ async def build_filter_query(filter_request: FilterRequest) -> Dict[str, Any]:
         query["state"] = {"$in": filter_request.states}
     
     if filter_request.years:
-        if filter_request.collection == "covid_stats":
-            # For COVID data, filter by year from date field
-            year_filters = []
-            for year in filter_request.years:
-                year_filters.append({
-                    "date": {"$regex": f"^{year}-"}
-                })
-            query["$or"] = year_filters
-        else:
-            query["year"] = {"$in": filter_request.years}
+        query["year"] = {"$in": filter_request.years}
     
     if filter_request.crime_types and filter_request.collection == "crimes":
         query["crime_type"] = {"$in": filter_request.crime_types}
     
     return query
 
-async def get_enhanced_web_insights(data_sample: List[Dict], collection_name: str, query: str, chart_type: str = "bar") -> Dict[str, Any]:
-    """Generate enhanced insights using MongoDB data analysis (no OpenAI)"""
+# Helper functions for insight metrics
+INSIGHT_MEASURES = {name: cube["measures"] for name, cube in ROLLUP_CUBES.items()}
+
+def insight_metrics_pipeline(collection_name: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One $group over the full filtered set: measure statistics plus distinct years and states"""
+    group = {
+        "_id": None,
+        "records": {"$sum": 1},
+        "years": {"$addToSet": "$year"},
+        "states": {"$addToSet": "$state"},
+    }
+    if collection_name == "crimes":
+        group["crime_types"] = {"$addToSet": "$crime_type"}
+    for measure in INSIGHT_MEASURES.get(collection_name, []):
+        group[f"{measure}__count"] = {"$sum": {"$cond": [{"$isNumber": f"${measure}"}, 1, 0]}}
+        group[f"{measure}__sum"] = {"$sum": f"${measure}"}
+        group[f"{measure}__avg"] = {"$avg": f"${measure}"}
+        group[f"{measure}__min"] = {"$min": f"${measure}"}
+        group[f"{measure}__max"] = {"$max": f"${measure}"}
+        group[f"{measure}__std"] = {"$stdDevPop": f"${measure}"}
+    return [{"$match": query}, {"$group": group}]
+
+def shape_insight_metrics(row: Dict[str, Any], measures: List[str]) -> Dict[str, Any]:
+    """Turn the grouped row into the metrics shape insight generation reads"""
+    metrics = {
+        "records": row.get("records", 0),
+        "years": sorted(year for year in row.get("years", []) if year is not None),
+        "states": sorted(state for state in row.get("states", []) if state),
+        "crime_types": sorted(crime_type for crime_type in row.get("crime_types", []) if crime_type),
+        "measures": {}
+    }
+    for measure in measures:
+        metrics["measures"][measure] = {
+            stat: row.get(f"{measure}__{stat}") for stat in ("count", "sum", "avg", "min", "max", "std")
+        }
+        metrics["measures"][measure]["count"] = metrics["measures"][measure]["count"] or 0
+    return metrics
+
+async def get_insight_metrics(collection_name: str, query: Dict[str, Any], profile: str = "analytics") -> Optional[Dict[str, Any]]:
+    """Insight metrics over every matching document, from the in-memory columns when possible; only the one summary row crosses the wire otherwise"""
     try:
+        metrics = insight_metrics_from_snapshot(collection_name, query)
+        if metrics is not None:
+            return metrics
+    except Exception as e:
+        logging.error(f"Public store insight metrics error for {collection_name}: {e}")
+    try:
+        rows = await single_flight(
+            single_flight_key("insight_metrics", collection_name, query, profile),
+            lambda: read_collection(collection_name, profile).aggregate(insight_metrics_pipeline(collection_name, query)).to_list(1)
+        )
+        return shape_insight_metrics(rows[0] if rows else {}, INSIGHT_MEASURES.get(collection_name, []))
+    except Exception as e:
+        logging.error(f"Insight metrics error for {collection_name}: {e}")
+        return None
+
+# Helper functions for the vectorized insight engine (columns the public store already holds)
+def numeric_values(frame: Dict[str, Any], field: str) -> np.ndarray:
+    """Numeric values present in a column, without missing or non-numeric entries"""
+    column = frame["columns"].get(field)
+    if column is None:
+        return np.empty(0)
+    present = frame["present"][field]
+    if column.dtype.kind == "i":
+        return column[present]
+    if column.dtype.kind == "f":
+        return column[present & ~np.isnan(column)]
+    # Mixed columns (numbers alongside None or strings) are filtered element-wise once
+    values = column[present]
+    numeric = np.fromiter(
+        (isinstance(v, (int, float)) and not isinstance(v, bool) and v == v for v in values),
+        dtype=bool, count=len(values)
+    )
+    return values[numeric].astype(np.float64)
+
+def distinct_values(frame: Dict[str, Any], field: str) -> List[Any]:
+    """Sorted distinct non-null values of a column"""
+    column = frame["columns"].get(field)
+    if column is None:
+        return []
+    present = frame["present"][field]
+    if column.dtype.kind in "if":
+        values = column[present]
+        if column.dtype.kind == "f":
+            values = values[~np.isnan(values)]
+        return np.unique(values).tolist()
+    return sorted({value for value in column[present].tolist() if value is not None}, key=str)
+
+def summarize_values(values: np.ndarray, records: int) -> Dict[str, Any]:
+    """Summarize a column's numeric values with the statistics of the insight metrics pipeline"""
+    if not values.size:
+        return {"records": records, "count": 0, "sum": 0, "avg": 0, "min": None, "max": None, "std": None}
+    return {
+        "records": records,
+        "count": int(values.size),
+        "sum": values.sum().item(),
+        "avg": float(values.mean()),
+        "min": values.min().item(),
+        "max": values.max().item(),
+        "std": float(values.std())
+    }
+
+def select_frame(snapshot: Dict[str, Any], selected: np.ndarray, fields: List[str]) -> Dict[str, Any]:
+    """The selected rows of a few snapshot columns, in the shape the engine helpers read"""
+    fields = [field for field in fields if field in snapshot["columns"]]
+    return {
+        "fields": fields,
+        "columns": {field: snapshot["columns"][field][selected] for field in fields},
+        "present": {field: snapshot["present"][field][selected] for field in fields},
+        "length": int(selected.sum())
+    }
+
+def insight_metrics_from_snapshot(collection_name: str, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Insight metrics computed from a public collection's in-memory columns; None when the snapshot cannot answer"""
+    snapshot = get_public_snapshot(collection_name)
+    if snapshot is None:
+        return None
+    selected = select_public_rows(snapshot, query)
+    if selected is None:
+        return None
+    measures = INSIGHT_MEASURES.get(collection_name, [])
+    frame = select_frame(snapshot, selected, ["year", "state", "crime_type"] + measures)
+    row = {
+        "records": frame["length"],
+        "years": distinct_values(frame, "year"),
+        "states": distinct_values(frame, "state"),
+        "crime_types": distinct_values(frame, "crime_type") if collection_name == "crimes" else [],
+    }
+    for measure in measures:
+        summary = summarize_values(numeric_values(frame, measure), frame["length"])
+        if not summary["count"]:
+            # Matches the pipeline, whose $avg/$min/$max/$std stay null without numeric values
+            row.update({f"{measure}__count": 0, f"{measure}__sum": 0})
+            continue
+        row.update({f"{measure}__{stat}": summary[stat] for stat in ("count", "sum", "avg", "min", "max", "std")})
+    return shape_insight_metrics(row, measures)
+
+def summarize_records(records: List[Dict], collection_name: str) -> Dict[str, Any]:
+    """Insight metrics computed from records already in hand, in the shape get_insight_metrics returns"""
+    row = {
+        "records": len(records),
+        "years": list({item.get('year') for item in records}),
+        "states": list({item.get('state') for item in records}),
+        "crime_types": list({item.get('crime_type') for item in records}) if collection_name == "crimes" else [],
+    }
+    for measure in INSIGHT_MEASURES.get(collection_name, []):
+        values = [item[measure] for item in records if isinstance(item.get(measure), (int, float)) and not isinstance(item.get(measure), bool)]
+        if not values:
+            row[f"{measure}__count"] = 0
+            row[f"{measure}__sum"] = 0
+            continue
+        avg = sum(values) / len(values)
+        row.update({
+            f"{measure}__count": len(values),
+            f"{measure}__sum": sum(values),
+            f"{measure}__avg": avg,
+            f"{measure}__min": min(values),
+            f"{measure}__max": max(values),
+            f"{measure}__std": (sum((value - avg) ** 2 for value in values) / len(values)) ** 0.5
+        })
+    return shape_insight_metrics(row, INSIGHT_MEASURES.get(collection_name, []))
+
+async def get_enhanced_web_insights(data_sample: List[Dict], collection_name: str, query: str, chart_type: str = "bar", metrics: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Generate enhanced insights using MongoDB data analysis (no OpenAI); metrics cover the full filtered set when given"""
+    try:
+        if metrics is None or not metrics["records"]:
+            metrics = summarize_records(data_sample, collection_name)
+        measures = metrics["measures"]
+        
         # Advanced data analysis without AI
         context_info = {
             "collection": collection_name,
             "sample_size": len(data_sample),
+            "analyzed_records": metrics["records"],
             "data_structure": list(data_sample[0].keys()) if data_sample else [],
             "chart_type": chart_type
         }
@@ -317,20 +2272,20 @@ async def get_enhanced_web_insights(data_sample: List[Dict], collection_name: st
                     temporal_fields.append(key)
             
             # Enhanced insights based on data structure and collection type
-            key_findings.append(f"Analyzed {len(data_sample)} records from {collection_name} collection")
+            key_findings.append(f"Analyzed {metrics['records']:,} records from {collection_name} collection")
             key_findings.append(f"Data structure: {len(numeric_fields)} numeric fields, {len(categorical_fields)} categorical fields")
             
             # Collection-specific advanced analysis
             if collection_name == "crimes":
                 # Crime-specific analysis
-                total_crimes = sum(item.get('cases_reported', item.get('count', 0)) for item in data_sample)
-                avg_crimes = total_crimes / len(data_sample) if data_sample else 0
+                cases = measures["cases_reported"]
+                total_crimes = cases["sum"] or 0
+                avg_crimes = total_crimes / metrics["records"] if metrics["records"] else 0
                 key_findings.append(f"Total crime cases: {total_crimes:,} with average {avg_crimes:.1f} per record")
                 
                 # Analyze crime types if available
-                crime_types = set(item.get('crime_type', 'Unknown') for item in data_sample)
-                if len(crime_types) > 1:
-                    key_findings.append(f"Crime type diversity: {len(crime_types)} different types identified")
+                if len(metrics["crime_types"]) > 1:
+                    key_findings.append(f"Crime type diversity: {len(metrics['crime_types'])} different types identified")
                 
                 recommendations.extend([
                     "Implement targeted crime prevention in high-crime areas",
@@ -344,12 +2299,10 @@ async def get_enhanced_web_insights(data_sample: List[Dict], collection_name: st
                 
             elif collection_name == "literacy":
                 # Literacy-specific analysis
-                rates = [item.get('literacy_rate', 0) for item in data_sample if item.get('literacy_rate')]
-                if rates:
-                    avg_rate = sum(rates) / len(rates)
-                    max_rate = max(rates)
-                    min_rate = min(rates)
-                    key_findings.append(f"Literacy rates: {avg_rate:.1f}% average (range: {min_rate:.1f}% - {max_rate:.1f}%)")
+                rates = measures["literacy_rate"]
+                if rates["count"]:
+                    avg_rate, max_rate, min_rate = rates["avg"], rates["max"], rates["min"]
+                    key_findings.append(f"Literacy rates: {avg_rate:.1f}% average (range: {min_rate:.1f}% - {max_rate:.1f}%, std dev {rates['std']:.1f})")
                     
                     if max_rate - min_rate > 20:
                         anomalies.append("High literacy disparity between regions detected")
@@ -370,12 +2323,10 @@ async def get_enhanced_web_insights(data_sample: List[Dict], collection_name: st
                 
             elif collection_name == "aqi":
                 # Air Quality analysis
-                aqi_values = [item.get('aqi', 0) for item in data_sample if item.get('aqi')]
-                if aqi_values:
-                    avg_aqi = sum(aqi_values) / len(aqi_values)
-                    max_aqi = max(aqi_values)
-                    min_aqi = min(aqi_values)
-                    key_findings.append(f"Air Quality Index: {avg_aqi:.1f} average (range: {min_aqi} - {max_aqi})")
+                aqi_values = measures["avg_aqi"]
+                if aqi_values["count"]:
+                    avg_aqi, max_aqi, min_aqi = aqi_values["avg"], aqi_values["max"], aqi_values["min"]
+                    key_findings.append(f"Air Quality Index: {avg_aqi:.1f} average (range: {min_aqi} - {max_aqi}, std dev {aqi_values['std']:.1f})")
                     
                     if avg_aqi > 150:
                         trend = "deteriorating"
@@ -392,21 +2343,17 @@ async def get_enhanced_web_insights(data_sample: List[Dict], collection_name: st
                         recommendations.append("Maintain current environmental standards")
                 
             elif collection_name == "power_consumption":
-                # Power consumption analysis
-                consumption_values = [item.get('consumption', item.get('power_consumption_gwh', 0)) for item in data_sample]
-                consumption_values = [v for v in consumption_values if v > 0]
+                # Power consumption analysis (either measure name, whichever the rows carry)
+                consumption = next((measures[m] for m in ("consumption", "power_consumption_gwh") if measures[m]["count"]), None)
                 
-                if consumption_values:
-                    avg_consumption = sum(consumption_values) / len(consumption_values)
-                    max_consumption = max(consumption_values)
-                    min_consumption = min(consumption_values)
-                    key_findings.append(f"Power consumption: {avg_consumption:.1f} average (range: {min_consumption} - {max_consumption})")
+                if consumption:
+                    key_findings.append(f"Power consumption: {consumption['avg']:.1f} average (range: {consumption['min']} - {consumption['max']})")
                     
                     # Analyze year-over-year trends if temporal data available
-                    years = [item.get('year') for item in data_sample if item.get('year')]
-                    if len(set(years)) > 1:
+                    years = metrics["years"]
+                    if len(years) > 1:
                         trend = "variable"
-                        key_findings.append(f"Data spans {len(set(years))} years: {min(years)} to {max(years)}")
+                        key_findings.append(f"Data spans {len(years)} years: {min(years)} to {max(years)}")
                     
                     recommendations.extend([
                         "Optimize energy distribution based on consumption patterns",
@@ -415,17 +2362,13 @@ async def get_enhanced_web_insights(data_sample: List[Dict], collection_name: st
                     ])
             
             # Temporal analysis if year data is available
-            if 'year' in data_sample[0]:
-                years = [item.get('year') for item in data_sample if item.get('year')]
-                unique_years = sorted(set(years))
-                if len(unique_years) > 1:
-                    key_findings.append(f"Temporal coverage: {len(unique_years)} years ({min(unique_years)}-{max(unique_years)})")
+            unique_years = metrics["years"]
+            if len(unique_years) > 1:
+                key_findings.append(f"Temporal coverage: {len(unique_years)} years ({min(unique_years)}-{max(unique_years)})")
             
             # Regional analysis if state data is available
-            if 'state' in data_sample[0]:
-                states = [item.get('state') for item in data_sample if item.get('state')]
-                unique_states = set(states)
-                key_findings.append(f"Geographic coverage: {len(unique_states)} states/regions")
+            if metrics["states"]:
+                key_findings.append(f"Geographic coverage: {len(metrics['states'])} states/regions")
         
         # Chart-specific visualization insights
         chart_insights = {
@@ -436,14 +2379,14 @@ async def get_enhanced_web_insights(data_sample: List[Dict], collection_name: st
         }
         
         return {
-            "insight": f"Comprehensive analysis of {collection_name} data reveals {len(data_sample)} records with rich insights across multiple dimensions. The dataset shows {trend} patterns with significant regional variations and temporal trends suitable for {chart_type} visualization.",
+            "insight": f"Comprehensive analysis of {collection_name} data reveals {metrics['records']:,} records with rich insights across multiple dimensions. The dataset shows {trend} patterns with significant regional variations and temporal trends suitable for {chart_type} visualization.",
             "chart_type": chart_type,
             "key_findings": key_findings[:4],  # Top 4 findings
             "anomalies": anomalies,
             "trend": trend,
             "recommendations": recommendations[:3],  # Top 3 recommendations
-            "comparison_insights": f"Analysis reveals significant variations across {len(set(item.get('state', 'Unknown') for item in data_sample))} regions with distinct patterns",
-            "temporal_analysis": f"Data trends show {trend} patterns over the analyzed time period" + (f" spanning {len(set(item.get('year') for item in data_sample if item.get('year')))} years" if any('year' in item for item in data_sample) else ""),
+            "comparison_insights": f"Analysis reveals significant variations across {len(metrics['states'])} regions with distinct patterns",
+            "temporal_analysis": f"Data trends show {trend} patterns over the analyzed time period" + (f" spanning {len(metrics['years'])} years" if metrics["years"] else ""),
             "visualization_notes": chart_insights.get(chart_type, f"{chart_type} chart effectively displays the data relationships")
         }
         
@@ -534,8 +2477,19 @@ async def process_enhanced_query(query: str) -> Dict[str, Any]:
         'original_query': query
     }
 
-async def generate_specific_response(data: List[Dict], query_info: Dict) -> str:
-    """Generate human-readable responses for specific queries"""
+def summarize_sample(values: List[float], records: int) -> Dict[str, Any]:
+    """Summarize measure values taken from a handful of raw rows in the same shape as get_measure_summary"""
+    return {
+        "records": records,
+        "count": len(values),
+        "sum": sum(values),
+        "avg": sum(values) / len(values) if values else 0,
+        "min": min(values) if values else None,
+        "max": max(values) if values else None
+    }
+
+async def generate_specific_response(data: List[Dict], query_info: Dict, aggregates: Optional[Dict[str, Any]] = None) -> str:
+    """Generate human-readable responses for specific queries (aggregates cover the full filtered set)"""
     if not data:
         return f"I couldn't find any {query_info['data_type']} data for your specific query. Try asking about different states or years, or check if the data exists in our database."
     
@@ -545,8 +2499,13 @@ async def generate_specific_response(data: List[Dict], query_info: Dict) -> str:
     response = f"📊 **{query_info['data_type'].title()} Data Analysis**\n\n"
     
     if query_info['collection'] == 'crimes':
-        total_cases = sum(item.get('cases_reported', 0) for item in data)
-        avg_cases = total_cases / len(data) if data else 0
+        if aggregates:
+            total_cases = aggregates['summary']['sum'] or 0
+            record_count = aggregates['summary']['records']
+        else:
+            total_cases = sum(item.get('cases_reported', 0) for item in data)
+            record_count = len(data)
+        avg_cases = total_cases / record_count if record_count else 0
         
         if query_info['states']:
             response += f"For **{states_str}**"
@@ -556,14 +2515,17 @@ async def generate_specific_response(data: List[Dict], query_info: Dict) -> str:
         
         response += f"• **Total Cases**: {total_cases:,}\n"
         response += f"• **Average per Record**: {avg_cases:.1f}\n"
-        response += f"• **Records Found**: {len(data)}\n"
+        response += f"• **Records Found**: {record_count}\n"
         
         # Crime types breakdown
-        crime_types = {}
-        for item in data:
-            crime_type = item.get('crime_type', 'Unknown')
-            cases = item.get('cases_reported', 0)
-            crime_types[crime_type] = crime_types.get(crime_type, 0) + cases
+        if aggregates:
+            crime_types = aggregates['breakdown']
+        else:
+            crime_types = {}
+            for item in data:
+                crime_type = item.get('crime_type', 'Unknown')
+                cases = item.get('cases_reported', 0)
+                crime_types[crime_type] = crime_types.get(crime_type, 0) + cases
         
         if crime_types:
             response += f"\n**Crime Types Breakdown**:\n"
@@ -571,11 +2533,12 @@ async def generate_specific_response(data: List[Dict], query_info: Dict) -> str:
                 response += f"• {crime_type}: {cases:,} cases\n"
     
     elif query_info['collection'] == 'literacy':
-        rates = [item.get('literacy_rate', 0) for item in data if item.get('literacy_rate')]
-        if rates:
-            avg_rate = sum(rates) / len(rates)
-            max_rate = max(rates)
-            min_rate = min(rates)
+        summary = aggregates['summary'] if aggregates else summarize_sample(
+            [item.get('literacy_rate', 0) for item in data if item.get('literacy_rate')], len(data))
+        if summary['count']:
+            avg_rate = summary['avg']
+            max_rate = summary['max']
+            min_rate = summary['min']
             
             response += f"For **{states_str}**"
             if query_info['years']:
@@ -585,14 +2548,15 @@ async def generate_specific_response(data: List[Dict], query_info: Dict) -> str:
             response += f"• **Average Literacy Rate**: {avg_rate:.1f}%\n"
             response += f"• **Highest Rate**: {max_rate:.1f}%\n"
             response += f"• **Lowest Rate**: {min_rate:.1f}%\n"
-            response += f"• **Records Analyzed**: {len(data)}\n"
+            response += f"• **Records Analyzed**: {summary['records']}\n"
     
     elif query_info['collection'] == 'aqi':
-        aqi_values = [item.get('aqi', 0) for item in data if item.get('aqi')]
-        if aqi_values:
-            avg_aqi = sum(aqi_values) / len(aqi_values)
-            max_aqi = max(aqi_values)
-            min_aqi = min(aqi_values)
+        summary = aggregates['summary'] if aggregates else summarize_sample(
+            [item.get('avg_aqi', 0) for item in data if item.get('avg_aqi')], len(data))
+        if summary['count']:
+            avg_aqi = summary['avg']
+            max_aqi = summary['max']
+            min_aqi = summary['min']
             
             response += f"For **{states_str}**"
             if query_info['years']:
@@ -602,7 +2566,7 @@ async def generate_specific_response(data: List[Dict], query_info: Dict) -> str:
             response += f"• **Average AQI**: {avg_aqi:.1f}\n"
             response += f"• **Highest AQI**: {max_aqi} (Poor)\n"
             response += f"• **Lowest AQI**: {min_aqi} (Good)\n"
-            response += f"• **Records Analyzed**: {len(data)}\n"
+            response += f"• **Records Analyzed**: {summary['records']}\n"
             
             # AQI quality assessment
             if avg_aqi > 150:
@@ -613,11 +2577,12 @@ async def generate_specific_response(data: List[Dict], query_info: Dict) -> str:
                 response += f"\n✅ **Air Quality**: Good - Safe for outdoor activities"
     
     elif query_info['collection'] == 'power_consumption':
-        consumption_values = [item.get('consumption', 0) for item in data if item.get('consumption')]
-        if consumption_values:
-            avg_consumption = sum(consumption_values) / len(consumption_values)
-            max_consumption = max(consumption_values)
-            min_consumption = min(consumption_values)
+        summary = aggregates['summary'] if aggregates else summarize_sample(
+            [item.get('consumption', 0) for item in data if item.get('consumption')], len(data))
+        if summary['count']:
+            avg_consumption = summary['avg']
+            max_consumption = summary['max']
+            min_consumption = summary['min']
             
             response += f"For **{states_str}**"
             if query_info['years']:
@@ -627,7 +2592,7 @@ async def generate_specific_response(data: List[Dict], query_info: Dict) -> str:
             response += f"• **Average Consumption**: {avg_consumption:.1f} units\n"
             response += f"• **Peak Consumption**: {max_consumption}\n"
             response += f"• **Minimum Consumption**: {min_consumption}\n"
-            response += f"• **Records Analyzed**: {len(data)}\n"
+            response += f"• **Records Analyzed**: {summary['records']}\n"
     
     return response
 async def get_simple_insight(data_sample: List[Dict], query: str) -> Dict[str, Any]:
@@ -697,7 +2662,7 @@ async def fallback_search(query: str):
         for collection in collections:
             try:
                 # Simple text search or get sample data
-                data = await db[collection].find({}).limit(10).to_list(10)
+                data = await read_collection(collection, "analytics").find({}).limit(10).to_list(10)
                 if data:
                     # Clean data
                     cleaned_data = []
@@ -754,24 +2719,41 @@ async def fallback_search(query: str):
             "total_collections_searched": 0
         }
 
-async def get_chart_recommendations(data: List[Dict]) -> Dict[str, Any]:
+async def get_chart_recommendations(data: List[Dict], field_stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Analyze data structure and recommend best chart types"""
     if not data:
         return {"recommended": "bar", "alternatives": ["line", "pie"]}
     
-    # Simple heuristics for chart recommendation
-    sample = data[0] if data else {}
     numeric_fields = []
     categorical_fields = []
     date_fields = []
     
-    for key, value in sample.items():
-        if isinstance(value, (int, float)):
-            numeric_fields.append(key)
-        elif isinstance(value, str):
-            categorical_fields.append(key)
-        elif isinstance(value, datetime):
-            date_fields.append(key)
+    if field_stats:
+        # Classify the returned fields with collection-wide statistics rather than the first row
+        returned = set().union(*(doc.keys() for doc in data))
+        for key, stats in field_stats["fields"].items():
+            if key not in returned or stats["distinct"] <= 1:
+                continue
+            if stats["kind"] == "numeric" and key not in ("year", "month"):
+                numeric_fields.append(key)
+            elif stats["kind"] == "temporal" or key in ("year", "month"):
+                if len({doc.get(key) for doc in data}) > 1:  # a single period is not a trend
+                    date_fields.append(key)
+            elif stats["kind"] == "categorical":
+                categorical_fields.append(key)
+        low_cardinality = [key for key in categorical_fields if field_stats["fields"][key]["distinct"] <= FIELD_STATS_LOW_CARDINALITY]
+        if len(numeric_fields) == 1 and len(low_cardinality) == 1 and len(categorical_fields) == 1:
+            return {"recommended": "pie", "alternatives": ["doughnut", "bar"]}
+    else:
+        # Simple heuristics for chart recommendation
+        sample = data[0] if data else {}
+        for key, value in sample.items():
+            if isinstance(value, (int, float)):
+                numeric_fields.append(key)
+            elif isinstance(value, str):
+                categorical_fields.append(key)
+            elif isinstance(value, datetime):
+                date_fields.append(key)
     
     # Chart recommendation logic
     if date_fields and numeric_fields:
@@ -788,6 +2770,13 @@ async def get_chart_recommendations(data: List[Dict]) -> Dict[str, Any]:
 async def root():
     return {"message": "TRACITY API - Your AI Data Companion"}
 
+@api_router.get("/ready")
+async def get_readiness():
+    """Readiness probe: 503 until the startup warm-up has preloaded caches"""
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail={"ready": False, "steps": readiness["steps"]})
+    return readiness
+
 # Authentication Routes
 @api_router.get("/captcha")
 async def get_captcha():
@@ -945,8 +2934,8 @@ async def get_user_file_data(file_id: str, user_data: dict = Depends(verify_toke
             raise HTTPException(status_code=404, detail="File not found")
         
         # Get file data
-        collection_name = file_metadata['collection_name']
-        file_data = await db[collection_name].find({'file_id': file_id}).to_list(1000)
+        rows = upload_rows(file_metadata)
+        file_data = await rows.find({'file_id': file_id}).to_list(1000)
         
         # Process data for response
         processed_data = []
@@ -1003,8 +2992,8 @@ async def get_filtered_user_file_data(
             query["year"] = {"$in": filter_request.years}
             
         # Get filtered data
-        collection_name = file_metadata['collection_name']
-        file_data = await db[collection_name].find(query).limit(filter_request.limit or 1000).to_list(1000)
+        rows = upload_rows(file_metadata)
+        file_data = await rows.find(query).limit(filter_request.limit or 1000).to_list(1000)
         
         # Process data for response
         processed_data = []
@@ -1023,7 +3012,7 @@ async def get_filtered_user_file_data(
             'filename': file_metadata['filename'],
             'data': processed_data,
             'record_count': len(processed_data),
-            'total_count': await db[collection_name].count_documents({'file_id': file_id}),
+            'total_count': await rows.count_documents({'file_id': file_id}),
             'returned_count': len(processed_data),
             'filters_applied': {
                 'states': filter_request.states,
@@ -1052,29 +3041,30 @@ async def get_user_file_metadata(file_id: str, user_data: dict = Depends(verify_
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found")
         
-        collection_name = file_metadata['collection_name']
+        rows = upload_rows(file_metadata)
         
         # Get available states from the file
-        available_states = await db[collection_name].distinct("state", {'file_id': file_id})
+        available_states = await rows.distinct("state", {'file_id': file_id})
         available_states = [state for state in available_states if state] # Filter out None values
         available_states.sort()
         
         # Get available years from the file
-        available_years = await db[collection_name].distinct("year", {'file_id': file_id})
+        available_years = await rows.distinct("year", {'file_id': file_id})
         available_years = [year for year in available_years if year and isinstance(year, int)]
         available_years.sort()
         
-        # Get all field names
-        sample_doc = await db[collection_name].find_one({'file_id': file_id})
-        fields = list(sample_doc.keys()) if sample_doc else []
-        fields = [f for f in fields if f not in ['_id', 'file_id', 'user_id', 'filename', 'upload_date']]
+        # Get all field names from a sample of the file's rows
+        field_schema = await get_collection_schema(
+            rows.name, {'file_id': file_id}, exclude=('file_id', 'user_id', 'filename', 'upload_date'), database=rows.database
+        )
         
         return {
             'file_id': file_id,
             'filename': file_metadata['filename'],
             'available_states': available_states,
             'available_years': available_years,
-            'available_fields': fields,
+            'available_fields': [field['name'] for field in field_schema],
+            'field_schema': field_schema,
             'record_count': file_metadata['record_count']
         }
         
@@ -1084,6 +3074,26 @@ async def get_user_file_metadata(file_id: str, user_data: dict = Depends(verify_
         logging.error(f"Get user file metadata error: {e}")
         raise HTTPException(status_code=500, detail="Failed to get file metadata")
 
+@api_router.get("/user/statistics/{file_id}")
+async def get_user_file_statistics(file_id: str, user_data: dict = Depends(verify_token)):
+    """Get per-field distinct counts, histograms and null ratios for a user file"""
+    try:
+        file_metadata = await db['user_files'].find_one({
+            'file_id': file_id,
+            'user_id': user_data['user_id']
+        })
+        if not file_metadata:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        stats = await get_file_field_statistics(upload_rows(file_metadata), file_id)
+        return {"file_id": file_id, "filename": file_metadata['filename'], **stats}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Get user file statistics error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get file statistics")
+
 @api_router.post("/user/insights/{file_id}")
 async def get_user_file_insights(
     file_id: str, 
@@ -1102,10 +3112,11 @@ async def get_user_file_insights(
         
         if not file_metadata:
             raise HTTPException(status_code=404, detail="File not found")
+        count_usage("user_insights")
         
         # Get some sample data for analysis
-        collection_name = file_metadata['collection_name']
-        sample_data = await db[collection_name].find({'file_id': file_id}).limit(10).to_list(10)
+        rows = upload_rows(file_metadata)
+        sample_data = await rows.find({'file_id': file_id}).limit(10).to_list(10)
         
         # Extract column names and data types
         columns = []
@@ -1177,70 +3188,95 @@ async def get_user_file_insights(
 
 @api_router.get("/stats", response_model=StatsResponse)
 async def get_platform_stats():
-    """Get platform statistics for dashboard"""
+    """Get platform statistics for dashboard (snapshot counts plus live usage counters)"""
     try:
-        # Get collection stats
-        collections = await db.list_collection_names()
-        total_datasets = len(collections)
-        
-        # Count documents across collections
-        total_records = 0
-        for collection_name in collections:
-            count = await db[collection_name].count_documents({})
-            total_records += count
-        
-        # Simulate user and visualization stats (in real app, these would be tracked)
-        return StatsResponse(
-            total_visualizations=total_records // 100 + 7000,  # Approximate visualizations
-            total_users=12000 + (total_records // 1000),
-            total_datasets=total_datasets,
-            total_insights=total_records // 50 + 2500
-        )
+        if platform_stats["snapshot"] is None:
+            await single_flight(single_flight_key("platform_stats"), refresh_platform_stats)
+        return current_platform_stats()
     except Exception as e:
         logging.error(f"Error getting stats: {e}")
+        usage = usage_summary()
         return StatsResponse(
-            total_visualizations=7000,
-            total_users=12000,
-            total_datasets=5,
-            total_insights=2500
+            total_visualizations=usage["visualizations"],
+            total_users=0,
+            total_datasets=len(PUBLIC_COLLECTIONS),
+            total_insights=usage["insights"]
         )
 
+@api_router.get("/admin/usage")
+async def get_usage_counters(user_data: dict = Depends(verify_token)):
+    """Report usage counts per metric and per endpoint and dataset"""
+    per_endpoint = defaultdict(int)
+    for counts in (usage_totals, usage_pending):
+        for (endpoint, dataset), count in counts.items():
+            per_endpoint[f"{endpoint}:{dataset}" if dataset else endpoint] += count
+    return {"metrics": usage_summary(), "endpoints": dict(sorted(per_endpoint.items())), "pending": sum(usage_pending.values())}
+
 @api_router.get("/datasets")
-async def get_available_datasets():
-    """Get list of available datasets"""
+async def get_available_datasets(if_none_match: Optional[str] = Header(None)):
+    """Get list of available datasets from the registry, with HTTP validators for client caching"""
     try:
-        collections = await db.list_collection_names()
-        datasets = []
-        
-        for collection_name in collections:
-            if not collection_name.startswith('system.'):
-                count = await db[collection_name].count_documents({})
-                # Get a sample document to understand structure
-                sample = await db[collection_name].find_one()
-                
-                description = "Dataset containing various data points"
-                if "covid" in collection_name.lower():
-                    description = "COVID-19 statistics and trends data"
-                elif "crime" in collection_name.lower():
-                    description = "Crime statistics and safety data"
-                elif "education" in collection_name.lower() or "literacy" in collection_name.lower():
-                    description = "Education and literacy statistics"
-                elif "aqi" in collection_name.lower():
-                    description = "Air Quality Index measurements"
-                
-                datasets.append(DatasetInfo(
-                    name=collection_name.replace('_', ' ').title(),
-                    collection=collection_name,
-                    description=description,
-                    record_count=count,
-                    last_updated=datetime.utcnow()
-                ))
-        
-        return datasets
+        catalog = await get_dataset_catalog()
+        headers = {
+            "ETag": catalog["etag"],
+            "Last-Modified": catalog["last_modified"],
+            "Cache-Control": f"public, max-age={DATASETS_CACHE_MAX_AGE}"
+        }
+        if if_none_match and catalog["etag"] in [tag.strip() for tag in if_none_match.split(',')]:
+            return Response(status_code=304, headers=headers)
+        return Response(content=catalog["body"], media_type="application/json", headers=headers)
     except Exception as e:
         logging.error(f"Error getting datasets: {e}")
         return []
 
+@api_router.get("/admin/indexes")
+async def get_indexes_report(user_data: dict = Depends(verify_token)):
+    """Report missing, undeclared and unused indexes on public collections"""
+    try:
+        return await get_index_report()
+    except Exception as e:
+        logging.error(f"Index report error: {e}")
+        raise HTTPException(status_code=500, detail="Error building index report")
+
+@api_router.get("/admin/cache")
+async def get_result_cache_stats(user_data: dict = Depends(verify_token)):
+    """Report result cache size and hit/miss metrics"""
+    lookups = result_cache_stats["hits"] + result_cache_stats["misses"]
+    return {
+        **result_cache_stats,
+        "entries": len(result_cache),
+        "hit_ratio": result_cache_stats["hits"] / lookups if lookups else 0.0,
+        "max_entries": RESULT_CACHE_MAX_ENTRIES,
+        "max_bytes": RESULT_CACHE_MAX_BYTES,
+        "ttl_seconds": RESULT_CACHE_TTL_SECONDS,
+        "metadata": {
+            "entries": len(metadata_cache),
+            "invalidation": data_version_watch["mode"],
+            "versions": dict(collection_data_versions)
+        }
+    }
+
+@api_router.get("/statistics/{collection_name}")
+async def get_collection_statistics(collection_name: str):
+    """Get per-field distinct counts, histograms and null ratios for a public collection"""
+    if collection_name not in PUBLIC_COLLECTIONS:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    stats = get_field_statistics(collection_name)
+    if stats is None:
+        raise HTTPException(status_code=503, detail="Statistics are not available yet")
+    return {"collection": collection_name, **stats}
+
+@api_router.get("/admin/jobs")
+async def get_scheduled_jobs(user_data: dict = Depends(verify_token)):
+    """Report per-job run counts, timings and failures for the background scheduler"""
+    return {
+        name: {
+            **{key: value for key, value in job.items() if key != "func"},
+            "avg_ms": round(job["total_ms"] / job["runs"], 1) if job["runs"] else None
+        }
+        for name, job in scheduled_jobs.items()
+    }
+
 @api_router.get("/metadata/{collection_name}")
 async def get_dataset_metadata(collection_name: str):
     """Get metadata for a specific collection including available filters"""
@@ -1252,60 +3288,109 @@ async def get_dataset_metadata(collection_name: str):
         raise HTTPException(status_code=500, detail="Error retrieving dataset metadata")
 
 @api_router.post("/data/filtered")
-async def get_filtered_data(filter_request: FilterRequest):
+async def get_filtered_data(filter_request: FilterRequest, debug: Optional[Dict[str, Any]] = Depends(get_query_debug)):
     """Get filtered data from a collection with advanced filtering options"""
     try:
         # Verify collection exists
-        collections = await db.list_collection_names()
-        if filter_request.collection not in collections:
+        if not await collection_exists(filter_request.collection):
             raise HTTPException(status_code=404, detail="Collection not found")
         
         # Build query
         query = await build_filter_query(filter_request)
         
-        # Build sort criteria
-        sort_criteria = []
-        if filter_request.sort_by:
-            sort_direction = 1 if filter_request.sort_order == "asc" else -1
-            sort_criteria.append((filter_request.sort_by, sort_direction))
-        
-        # Execute query
-        cursor = db[filter_request.collection].find(query)
-        if sort_criteria:
-            cursor = cursor.sort(sort_criteria)
-        
-        data = await cursor.limit(filter_request.limit or 100).to_list(filter_request.limit or 100)
+        # Build sort criteria; multi-key sorts and page tokens on public collections must be index-backed,
+        # while the legacy sort_by/sort_order parameters keep accepting any field
+        sort_criteria = resolve_sort_criteria(filter_request)
+        paginated = bool(filter_request.sort or filter_request.page_token)
+        index_sort = None
+        if paginated and filter_request.collection in INDEX_REGISTRY and sort_criteria:
+            index_sort = resolve_index_sort(filter_request.collection, sort_criteria)
+            if index_sort is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Sorting on {', '.join(field for field, _ in sort_criteria)} is not index-backed. "
+                           f"Sortable key prefixes: {'; '.join(sortable_key_prefixes(filter_request.collection))}"
+                )
+        if paginated:
+            if filter_request.collection not in INDEX_REGISTRY:
+                raise HTTPException(status_code=400, detail="Pagination is only available for public collections")
+            sort_pattern = index_sort or [("_id", ASCENDING)]
+            if filter_request.page_token:
+                decode_page_token(filter_request.page_token, filter_request.collection, query, sort_pattern)
+        count_usage("data_filtered", filter_request.collection)
+        
+        # Debug requests bypass the cache so the query is actually executed and measured.
+        # Results are cached under the version read here, so a bump during the read discards them.
+        cache_key = result_cache_key("data/filtered", filter_request)
+        data_version = collection_data_versions[filter_request.collection]
+        if debug is None:
+            cached = result_cache_get(cache_key, filter_request.collection)
+            if cached is not None:
+                return cached
+        
+        # Execute query (multi-key sorts and page tokens use keyset pagination)
+        read_profile = endpoint_read_profile("data_filtered")
+        next_page_token = None
+        limit = filter_request.limit or 100
+        with debug_stage(debug, "find"):
+            if paginated:
+                data, next_page_token = await find_page(filter_request.collection, query, sort_pattern, limit, filter_request.page_token, profile=read_profile)
+                if debug is not None:
+                    debug["find_source"] = "mongo"
+            else:
+                data = await find_documents(filter_request.collection, query, sort_criteria, limit, debug=debug, profile=read_profile)
         
         # Process data for frontend
-        processed_data = []
-        for doc in data:
-            clean_doc = {k: v for k, v in doc.items() if k != '_id'}
-            # Convert datetime objects to strings
-            for key, value in clean_doc.items():
-                if isinstance(value, datetime):
-                    clean_doc[key] = value.isoformat()
-            processed_data.append(clean_doc)
+        with debug_stage(debug, "process"):
+            processed_data = []
+            for doc in data:
+                clean_doc = {k: v for k, v in doc.items() if k != '_id'}
+                # Convert datetime objects to strings
+                for key, value in clean_doc.items():
+                    if isinstance(value, datetime):
+                        clean_doc[key] = value.isoformat()
+                processed_data.append(clean_doc)
         
         # Get total count for the query
-        total_count = await db[filter_request.collection].count_documents(query)
+        with debug_stage(debug, "count"):
+            total_count = await count_matching_documents(filter_request.collection, query, debug=debug, profile=read_profile)
         
         # Get chart recommendations
-        chart_rec = await get_chart_recommendations(processed_data)
+        with debug_stage(debug, "chart_recommendations"):
+            chart_rec = await get_chart_recommendations(processed_data, get_field_statistics(filter_request.collection))
         
-        return {
+        result = {
             "collection": filter_request.collection,
             "data": processed_data,
             "total_count": total_count,
             "returned_count": len(processed_data),
+            "next_page_token": next_page_token,
             "chart_recommendations": chart_rec,
             "applied_filters": {
                 "states": filter_request.states,
                 "years": filter_request.years,
                 "crime_types": filter_request.crime_types,
                 "sort_by": filter_request.sort_by,
-                "sort_order": filter_request.sort_order
+                "sort_order": filter_request.sort_order,
+                "sort": [spec.dict() for spec in filter_request.sort] if filter_request.sort else None
             }
         }
+        if debug is None:
+            result_cache_put(cache_key, filter_request.collection, result, version=data_version)
+            return result
+        
+        # Explain what MongoDB does for this request, even when memory served it
+        if paginated:
+            explain_query = build_page_query(filter_request.collection, query, sort_pattern, filter_request.page_token)
+            explain_sort = sort_pattern
+        else:
+            explain_query, explain_sort = query, sort_criteria
+        debug["explain"]["find"], debug["explain"]["count"] = await asyncio.gather(
+            explain_find(filter_request.collection, explain_query, explain_sort, limit, profile=read_profile),
+            explain_count(filter_request.collection, query, profile=read_profile)
+        )
+        debug["query"] = json.loads(json_util.dumps(explain_query))
+        return {**result, "debug": debug}
         
     except HTTPException:
         raise
@@ -1313,13 +3398,80 @@ async def get_filtered_data(filter_request: FilterRequest):
         logging.error(f"Filtered data error: {e}")
         raise HTTPException(status_code=500, detail="Error processing filtered data request")
 
+@api_router.post("/data/aggregate")
+async def get_aggregated_data(aggregate_request: AggregateRequest):
+    """Group-by / pivot aggregation over a public collection"""
+    try:
+        if aggregate_request.collection not in PUBLIC_COLLECTIONS:
+            raise HTTPException(status_code=404, detail="Collection not found")
+        if not aggregate_request.measures:
+            raise HTTPException(status_code=400, detail="At least one measure is required")
+        for field in aggregate_request.dimensions + [measure.field for measure in aggregate_request.measures]:
+            if field.startswith('$') or '.' in field:
+                raise HTTPException(status_code=400, detail=f"Invalid field name: {field}")
+        for measure in aggregate_request.measures:
+            if measure.function not in AGGREGATE_FUNCTIONS:
+                raise HTTPException(status_code=400, detail=f"Unsupported function: {measure.function}")
+        if aggregate_request.pivot and aggregate_request.pivot not in aggregate_request.dimensions:
+            raise HTTPException(status_code=400, detail="Pivot must be one of the dimensions")
+        count_usage("aggregate", aggregate_request.collection)
+        
+        filters = {
+            "state": aggregate_request.states,
+            "year": aggregate_request.years,
+            "crime_type": aggregate_request.crime_types if aggregate_request.collection == "crimes" else None
+        }
+        measures = [(measure.field, measure.function) for measure in aggregate_request.measures]
+        names = [measure_name(field, func) for field, func in measures]
+        
+        rows, source = await run_aggregate(
+            aggregate_request.collection, filters, aggregate_request.dimensions, measures,
+            profile=endpoint_read_profile("aggregate")
+        )
+        try:
+            rows.sort(key=lambda row: tuple((row.get(d) is None, row.get(d)) for d in aggregate_request.dimensions))
+        except TypeError:
+            pass  # mixed value types, keep group order
+        
+        result = {
+            "collection": aggregate_request.collection,
+            "dimensions": aggregate_request.dimensions,
+            "measures": names,
+            "group_count": len(rows),
+            "source": source,
+            "applied_filters": {
+                "states": aggregate_request.states,
+                "years": aggregate_request.years,
+                "crime_types": aggregate_request.crime_types
+            }
+        }
+        if aggregate_request.pivot:
+            result.update(pivot_aggregate_rows(rows, aggregate_request.dimensions, aggregate_request.pivot, names))
+            result["rows"] = result["rows"][:aggregate_request.limit or 1000]
+        else:
+            result["rows"] = rows[:aggregate_request.limit or 1000]
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Aggregate error: {e}")
+        raise HTTPException(status_code=500, detail="Error processing aggregate request")
+
 @api_router.post("/insights/enhanced")
 async def get_enhanced_insights(filter_request: FilterRequest):
     """Get enhanced AI insights for filtered data"""
     try:
+        count_usage("insights_enhanced", filter_request.collection)
+        cache_key = result_cache_key("insights/enhanced", filter_request)
+        data_version = collection_data_versions[filter_request.collection]
+        cached = result_cache_get(cache_key, filter_request.collection)
+        if cached is not None:
+            return cached
+        
         # Get filtered data first
         query = await build_filter_query(filter_request)
-        data = await db[filter_request.collection].find(query).limit(50).to_list(50)
+        data = await find_documents(filter_request.collection, query, limit=50, profile=endpoint_read_profile("insights_enhanced"))
         
         if not data:
             raise HTTPException(status_code=404, detail="No data found for the specified filters")
@@ -1338,13 +3490,14 @@ async def get_enhanced_insights(filter_request: FilterRequest):
             processed_data, 
             filter_request.collection, 
             f"Analyze patterns in {filter_request.collection} data",
-            filter_request.chart_type or "bar"
+            filter_request.chart_type or "bar",
+            metrics=await get_insight_metrics(filter_request.collection, query, endpoint_read_profile("insights_enhanced"))
         )
         
         # Get total count for context
-        total_count = await db[filter_request.collection].count_documents(query)
+        total_count = await count_matching_documents(filter_request.collection, query, profile=endpoint_read_profile("insights_enhanced"))
         
-        return {
+        result = {
             "collection": filter_request.collection,
             "total_records": total_count,
             "analyzed_sample": len(processed_data),
@@ -1356,6 +3509,8 @@ async def get_enhanced_insights(filter_request: FilterRequest):
             },
             "generated_at": datetime.utcnow().isoformat()
         }
+        result_cache_put(cache_key, filter_request.collection, result, version=data_version)
+        return result
         
     except HTTPException:
         raise
@@ -1363,12 +3518,54 @@ async def get_enhanced_insights(filter_request: FilterRequest):
         logging.error(f"Enhanced insights error: {e}")
         raise HTTPException(status_code=500, detail="Error generating enhanced insights")
 
+async def run_batch_query(batch_query: BatchQuery) -> Any:
+    """Dispatch one batch entry to the endpoint handler it mirrors"""
+    if batch_query.type in ("filtered", "insights"):
+        if batch_query.filter is None:
+            raise HTTPException(status_code=400, detail=f"'{batch_query.type}' queries need a filter")
+        if batch_query.type == "filtered":
+            return await get_filtered_data(batch_query.filter, debug=None)
+        return await get_enhanced_insights(batch_query.filter)
+    if batch_query.type == "aggregate":
+        if batch_query.aggregate is None:
+            raise HTTPException(status_code=400, detail="'aggregate' queries need an aggregate spec")
+        return await get_aggregated_data(batch_query.aggregate)
+    if batch_query.type == "metadata":
+        if not batch_query.collection:
+            raise HTTPException(status_code=400, detail="'metadata' queries need a collection")
+        metadata = await get_collection_metadata(batch_query.collection)
+        return metadata.dict()
+    raise HTTPException(status_code=400, detail=f"Unknown query type: {batch_query.type}")
+
+@api_router.post("/batch")
+async def run_batch(batch_request: BatchRequest):
+    """Run many filtered/aggregate/insights/metadata queries concurrently and return all results at once"""
+    if len(batch_request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {BATCH_MAX_QUERIES} queries")
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def run_one(batch_query: BatchQuery) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                result = await run_batch_query(batch_query)
+                return {"id": batch_query.id, "type": batch_query.type, "status": 200, "result": result}
+            except HTTPException as e:
+                return {"id": batch_query.id, "type": batch_query.type, "status": e.status_code, "error": e.detail}
+            except Exception as e:
+                logging.error(f"Batch query error: {e}")
+                return {"id": batch_query.id, "type": batch_query.type, "status": 500, "error": "Error processing query"}
+    
+    results = await asyncio.gather(*(run_one(batch_query) for batch_query in batch_request.queries))
+    return {"results": results, "count": len(results)}
+
 @api_router.post("/chat")
 async def chat_with_ai(query: ChatQuery):
     """Enhanced AI chatbot endpoint for natural language queries with better data processing"""
     try:
         # Process the query for better understanding
         query_info = await process_enhanced_query(query.query)
+        count_usage("chat", query_info['collection'])
         
         # If specific data query detected, handle it specifically
         if query_info['collection'] and (query_info['states'] or query_info['years']):
@@ -1395,18 +3592,10 @@ async def chat_with_ai(query: ChatQuery):
                     db_query["state"] = {"$in": state_names}
                 
                 if query_info['years']:
-                    if query_info['collection'] == "covid_stats":
-                        # For COVID data, filter by year from date field
-                        year_filters = []
-                        for year in query_info['years']:
-                            year_filters.append({"date": {"$regex": f"^{year}-"}})
-                        if year_filters:
-                            db_query["$or"] = year_filters
-                    else:
-                        db_query["year"] = {"$in": query_info['years']}
+                    db_query["year"] = {"$in": query_info['years']}
                 
                 # Get specific data
-                data = await db[query_info['collection']].find(db_query).limit(50).to_list(50)
+                data = await find_documents(query_info['collection'], db_query, limit=50, profile=endpoint_read_profile("chat"))
                 
                 if data:
                     # Clean data to remove ObjectIds and convert dates
@@ -1419,8 +3608,15 @@ async def chat_with_ai(query: ChatQuery):
                                 clean_doc[key] = value.isoformat()
                         cleaned_data.append(clean_doc)
                     
+                    # Totals and breakdowns over the full filtered set (rollup cube when it covers the filters)
+                    aggregates = await get_measure_summary(
+                        query_info['collection'],
+                        {"state": db_query.get("state", {}).get("$in"), "year": query_info['years']},
+                        breakdown_by="crime_type" if query_info['collection'] == 'crimes' else None
+                    )
+                    
                     # Generate enhanced human-readable response
-                    insight = await generate_specific_response(cleaned_data, query_info)
+                    insight = await generate_specific_response(cleaned_data, query_info, aggregates)
                     
                     # Get chart recommendations
                     chart_rec = await get_chart_recommendations(cleaned_data)
@@ -1471,14 +3667,45 @@ async def chat_with_ai(query: ChatQuery):
         }
 
 @api_router.get("/visualize/{collection_name}")
-async def get_visualization_data(collection_name: str, limit: int = 50, states: str = None, years: str = None):
-    """Get data for visualization from specific collection with optional filtering"""
+async def get_visualization_data(collection_name: str, limit: int = 50, states: str = None, years: str = None,
+                                 granularity: str = None, start_date: str = None, end_date: str = None):
+    """Get data for visualization from specific collection with optional filtering (granularity or a date range opts into time buckets)"""
     try:
         # Verify collection exists
-        collections = await db.list_collection_names()
-        if collection_name not in collections:
+        if not await collection_exists(collection_name):
             raise HTTPException(status_code=404, detail="Collection not found")
         
+        if granularity is not None and granularity not in ["auto", "day"] + TIME_BUCKET_GRANULARITIES:
+            raise HTTPException(status_code=400, detail=f"granularity must be one of auto, day, {', '.join(TIME_BUCKET_GRANULARITIES)}")
+        for value in (start_date, end_date):
+            if value:
+                try:
+                    datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="start_date and end_date must be YYYY-MM-DD")
+        count_usage("visualize", collection_name)
+        
+        # Without granularity or dates, daily collections keep the row shape and limit clients chart directly
+        if collection_name in TIME_BUCKET_ROLLUPS and (granularity or start_date or end_date):
+            return await single_flight(
+                single_flight_key("visualize_series", collection_name, limit, states, years, granularity, start_date, end_date),
+                lambda: build_time_series_data(collection_name, limit, states, years, granularity, start_date, end_date)
+            )
+        
+        return await single_flight(
+            single_flight_key("visualize", collection_name, limit, states, years),
+            lambda: build_visualization_data(collection_name, limit, states, years)
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Visualization error: {e}")
+        raise HTTPException(status_code=500, detail="Error processing visualization data")
+
+async def build_visualization_data(collection_name: str, limit: int, states: Optional[str], years: Optional[str]) -> Dict[str, Any]:
+    """Build the visualization payload (shared by concurrent identical requests)"""
+    try:
         # Build query based on optional filters
         query = {}
         if states:
@@ -1494,37 +3721,31 @@ async def get_visualization_data(collection_name: str, limit: int = 50, states:
                 pass  # Ignore invalid years
             
             if year_list:
-                if collection_name == "covid_stats":
-                    # For COVID data, filter by year from date field
-                    year_filters = []
-                    for year in year_list:
-                        year_filters.append({"date": {"$regex": f"^{year}-"}})
-                    if year_filters:
-                        query["$or"] = year_filters
-                else:
-                    query["year"] = {"$in": year_list}
+                query["year"] = {"$in": year_list}
         
         # If no filters provided, try to get a representative sample from all states
         if not query:
-            # Get all states first
-            all_states = await db[collection_name].distinct("state")
             # For better visualization, limit to top 10-15 states and get recent data
             if collection_name != "covid_stats":
                 # Get latest year available
-                latest_years = await db[collection_name].distinct("year")
+                snapshot = get_public_snapshot(collection_name)
+                if snapshot is not None and snapshot["masks"].get("year"):
+                    latest_years = list(snapshot["masks"]["year"].keys())
+                else:
+                    latest_years = await read_collection(collection_name, endpoint_read_profile("visualize")).distinct("year")
                 if latest_years:
                     latest_year = max(latest_years)
                     query = {"year": latest_year}
             else:
                 # For COVID data, get recent data
-                query = {"date": {"$regex": "^202[0-3]"}}
+                query = {"year": {"$gte": 2020, "$lte": 2023}}
         
         # Get data
-        data = await db[collection_name].find(query).limit(limit).to_list(limit)
+        data = await find_documents(collection_name, query, limit=limit, profile=endpoint_read_profile("visualize"))
         
         # If still no data and filters were applied, try without filters
         if not data and (states or years):
-            data = await db[collection_name].find().limit(limit).to_list(limit)
+            data = await find_documents(collection_name, {}, limit=limit, profile=endpoint_read_profile("visualize"))
         
         # Process data for frontend
         processed_data = []
@@ -1537,14 +3758,15 @@ async def get_visualization_data(collection_name: str, limit: int = 50, states:
             processed_data.append(clean_doc)
         
         # Get chart recommendations
-        chart_rec = await get_chart_recommendations(processed_data)
+        chart_rec = await get_chart_recommendations(processed_data, get_field_statistics(collection_name))
         
         # Generate AI insights using enhanced method
         ai_insights = await get_enhanced_web_insights(
             processed_data, 
             collection_name, 
             f"Analyze the {collection_name} dataset patterns and trends",
-            "bar"  # Default chart type for general visualization
+            "bar",  # Default chart type for general visualization
+            metrics=await get_insight_metrics(collection_name, query, endpoint_read_profile("visualize"))
         )
         
         # Get metadata for context
@@ -1566,9 +3788,84 @@ async def get_visualization_data(collection_name: str, limit: int = 50, states:
         logging.error(f"Visualization error: {e}")
         raise HTTPException(status_code=500, detail="Error processing visualization data")
 
+async def build_time_series_data(collection_name: str, limit: int, states: Optional[str], years: Optional[str],
+                                 granularity: str, start_date: Optional[str], end_date: Optional[str]) -> Dict[str, Any]:
+    """Build the visualization payload for a daily collection at day, week or month resolution"""
+    state_list = [s.strip() for s in states.split(',') if s.strip()] if states else []
+    if years and not (start_date or end_date):
+        try:
+            year_list = [int(y.strip()) for y in years.split(',') if y.strip()]
+        except ValueError:
+            year_list = []
+        if year_list:
+            start_date, end_date = f"{min(year_list)}-01-01", f"{max(year_list)}-12-31"
+    
+    requested = granularity or "auto"
+    if requested == "auto":
+        granularity = choose_granularity(start_date, end_date)
+    
+    date_field = TIME_BUCKET_ROLLUPS[collection_name]["date_field"]
+    query = {}
+    if state_list:
+        query["state"] = {"$in": state_list}
+    if start_date or end_date:
+        query[date_field] = {key: value for key, value in (("$gte", start_date), ("$lte", end_date)) if value}
+    
+    data = None
+    if granularity != "day":
+        data = await find_time_buckets(
+            collection_name, granularity, state_list, start_date, end_date,
+            profile=endpoint_read_profile("visualize")
+        )
+    if data is None:
+        # Daily rows (or a rollup that is not built yet) are capped by limit
+        granularity = "day"
+        data = await find_documents(
+            collection_name, query, sort_criteria=[(date_field, 1)], limit=limit,
+            profile=endpoint_read_profile("visualize")
+        )
+        data = [{k: v for k, v in doc.items() if k != '_id'} for doc in data]
+    
+    chart_rec = await get_chart_recommendations(data, get_field_statistics(collection_name))
+    ai_insights = await get_enhanced_web_insights(
+        data,
+        collection_name,
+        f"Analyze the {collection_name} dataset patterns and trends",
+        "line",
+        metrics=await get_insight_metrics(collection_name, query, endpoint_read_profile("visualize"))
+    )
+    metadata = await get_collection_metadata(collection_name)
+    
+    return {
+        "collection": collection_name,
+        "data": data,
+        "chart_recommendations": chart_rec,
+        "ai_insights": ai_insights,
+        "total_records": len(data),
+        "metadata": metadata.dict(),
+        "granularity": granularity,
+        "granularity_requested": requested,
+        "date_range": {"start_date": start_date, "end_date": end_date}
+    }
+
 @api_router.get("/insights/{collection_name}")
 async def get_dataset_insights(collection_name: str, states: str = None, years: str = None):
     """Get AI-generated insights for a specific dataset with optional filtering"""
+    try:
+        count_usage("insights", collection_name)
+        return await single_flight(
+            single_flight_key("insights", collection_name, states, years),
+            lambda: build_dataset_insights(collection_name, states, years)
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Insights error: {e}")
+        raise HTTPException(status_code=500, detail="Error generating insights")
+
+async def build_dataset_insights(collection_name: str, states: Optional[str], years: Optional[str]) -> Dict[str, Any]:
+    """Build the insights payload (shared by concurrent identical requests)"""
     try:
         # Build query based on optional filters
         query = {}
@@ -1585,17 +3882,10 @@ async def get_dataset_insights(collection_name: str, states: str = None, years:
                 pass
             
             if year_list:
-                if collection_name == "covid_stats":
-                    year_filters = []
-                    for year in year_list:
-                        year_filters.append({"date": {"$regex": f"^{year}-"}})
-                    if year_filters:
-                        query["$or"] = year_filters
-                else:
-                    query["year"] = {"$in": year_list}
+                query["year"] = {"$in": year_list}
         
         # Get sample data
-        sample_data = await db[collection_name].find(query).limit(50).to_list(50)
+        sample_data = await find_documents(collection_name, query, limit=50, profile=endpoint_read_profile("insights"))
         
         if not sample_data:
             raise HTTPException(status_code=404, detail="No data found for the specified criteria")
@@ -1605,11 +3895,12 @@ async def get_dataset_insights(collection_name: str, states: str = None, years:
             sample_data, 
             collection_name, 
             f"Provide comprehensive analysis of the {collection_name} dataset including trends, patterns, and key findings",
-            "bar"  # Default chart type for insights
+            "bar",  # Default chart type for insights
+            metrics=await get_insight_metrics(collection_name, query, endpoint_read_profile("insights"))
         )
         
         # Calculate basic statistics
-        total_records = await db[collection_name].count_documents(query if query else {})
+        total_records = await count_matching_documents(collection_name, query if query else {}, profile=endpoint_read_profile("insights"))
         
         # Get metadata
         metadata = await get_collection_metadata(collection_name)
@@ -1652,8 +3943,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_tasks():
+    # Serve liveness immediately; /api/ready reports when the warm-up is done
+    app.state.warm_up_task = asyncio.create_task(warm_up())
+    # Jobs first run one interval from now, after the warm-up has filled the caches
+    register_background_jobs()
+    start_scheduler()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    stop_scheduler()
+    try:
+        await flush_usage_counters()
+    except Exception as e:
+        logging.error(f"Usage counter flush error on shutdown: {e}")
     client.close()
 
 if __name__ == "__main__":
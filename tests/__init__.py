@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The tests import backend/server.py directly; its Mongo client connects lazily, so no server is needed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
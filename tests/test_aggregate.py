@@ -0,0 +1,53 @@
+import unittest
+
+import server
+from tests.test_public_store import PublicStoreTestCase
+
+NO_FILTERS = {"state": None, "year": None, "crime_type": None}
+
+
+def by_key(rows, *dimensions):
+    return {tuple(row[dimension] for dimension in dimensions): row for row in rows}
+
+
+class AggregatePublicStoreTest(PublicStoreTestCase):
+    async def test_group_by_with_every_function(self):
+        measures = [("*", "count")] + [("cases_reported", func) for func in server.AGGREGATE_FUNCTIONS]
+        rows = by_key(server.aggregate_public_store("crimes", NO_FILTERS, ["state"], measures), "state")
+        self.assertEqual(set(rows), {("Kerala",), ("Goa",), ("Punjab",)})
+        goa = rows[("Goa",)]
+        # Goa's 2022 row has no cases_reported: counted as a row, ignored by the measure
+        self.assertEqual(goa["count"], 2)
+        self.assertEqual(goa["cases_reported_count"], 1)
+        self.assertEqual(goa["cases_reported_sum"], 7)
+        self.assertEqual(goa["cases_reported_avg"], 7.0)
+        self.assertEqual((goa["cases_reported_min"], goa["cases_reported_max"]), (7, 7))
+        self.assertEqual(rows[("Kerala",)]["cases_reported_sum"], 14)
+        self.assertIsInstance(rows[("Kerala",)]["cases_reported_sum"], int)
+
+    async def test_filters_and_multiple_dimensions(self):
+        filters = {"state": None, "year": [2021, 2022], "crime_type": ["Theft"]}
+        rows = by_key(server.aggregate_public_store("crimes", filters, ["state", "year"], [("cases_reported", "sum")]), "state", "year")
+        self.assertEqual(rows, {
+            ("Goa", 2021): {"state": "Goa", "year": 2021, "cases_reported_sum": 7},
+            ("Goa", 2022): {"state": "Goa", "year": 2022, "cases_reported_sum": 0},
+        })
+
+    async def test_no_dimensions_gives_one_total_row(self):
+        rows = server.aggregate_public_store("crimes", NO_FILTERS, [], [("*", "count"), ("cases_reported", "max")])
+        self.assertEqual(rows, [{"count": 5, "cases_reported_max": 12}])
+
+    async def test_missing_dimension_groups_as_null(self):
+        rows = server.aggregate_public_store("crimes", NO_FILTERS, ["district"], [("*", "count")])
+        self.assertEqual(rows, [{"district": None, "count": 5}])
+
+    async def test_empty_selection(self):
+        filters = {"state": ["Nowhere"], "year": None, "crime_type": None}
+        self.assertEqual(server.aggregate_public_store("crimes", filters, ["state"], [("*", "count")]), [])
+
+    async def test_non_numeric_measures_fall_back_to_mongo(self):
+        self.assertIsNone(server.aggregate_public_store("crimes", NO_FILTERS, ["year"], [("state", "max")]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import server
+from tests.test_public_store import CRIMES, install_snapshot
+
+
+class FakeVersionDocuments:
+    """Stands in for the data_versions collection, shared by every process in a test"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "version": 0})
+        doc["version"] += update["$inc"]["version"]
+        doc.update(update["$set"])
+        return dict(doc)
+
+    def publish_from(self, collection_name, origin):
+        doc = self.docs.setdefault(collection_name, {"_id": collection_name, "version": 0})
+        doc["version"] += 1
+        doc["origin"] = origin
+        return dict(doc)
+
+
+class DataVersionTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.versions = FakeVersionDocuments()
+        fake_db = MagicMock()
+        fake_db.__getitem__.side_effect = lambda name: self.versions
+        self.patch = patch.object(server, "db", fake_db)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        server.data_version_watch["seen"].clear()
+        server.public_data_store.clear()
+        server.public_store_refreshing.clear()
+        server.collection_data_versions.clear()
+        server.data_version_changed_at.clear()
+        server.rollup_cube_status.clear()
+
+
+class PublishedVersionTest(DataVersionTestCase):
+    async def test_own_publish_bumps_once(self):
+        await server.publish_data_change("crimes")
+        # The change stream then delivers the document this process just wrote
+        self.assertFalse(server.apply_published_version(dict(self.versions.docs["crimes"])))
+        self.assertEqual(server.collection_data_versions["crimes"], 1)
+
+    async def test_other_process_publish_bumps_once(self):
+        event = self.versions.publish_from("crimes", "other-process")
+        self.assertTrue(server.apply_published_version(event))
+        self.assertFalse(server.apply_published_version(event))  # redelivered or polled again
+        self.assertEqual(server.collection_data_versions["crimes"], 1)
+
+    async def test_publish_after_an_unseen_foreign_publish_bumps_for_both(self):
+        await server.publish_data_change("crimes")
+        late_event = self.versions.publish_from("crimes", "other-process")
+        await server.publish_data_change("crimes")
+        self.assertEqual(server.collection_data_versions["crimes"], 3)
+        self.assertFalse(server.apply_published_version(late_event))
+        self.assertEqual(server.collection_data_versions["crimes"], 3)
+
+    async def test_first_poll_only_records(self):
+        doc = self.versions.publish_from("crimes", "other-process")
+        self.assertFalse(server.apply_published_version(doc, record_only=True))
+        self.assertEqual(server.collection_data_versions["crimes"], 0)
+        self.assertTrue(server.apply_published_version(self.versions.publish_from("crimes", "other-process")))
+
+
+class ReloadAfterWriteTest(DataVersionTestCase):
+    async def test_reload_after_a_published_write_does_not_publish_again(self):
+        install_snapshot("crimes", CRIMES)
+        await server.publish_data_change("crimes")
+        server.rollup_cube_status["crimes"] = {"version": server.collection_data_versions["crimes"]}
+
+        changed = [dict(doc) for doc in CRIMES] + [{"state": "Goa", "year": 2023, "crime_type": "Fraud", "cases_reported": 1}]
+        rows = MagicMock()
+        rows.find.return_value.to_list = AsyncMock(return_value=changed)
+        with patch.object(server, "read_collection", MagicMock(return_value=rows)), \
+                patch.object(server, "update_dataset_registry", AsyncMock()), \
+                patch.object(server, "run_in_background", MagicMock(side_effect=lambda coro, description: coro.close())):
+            snapshot = await server.load_public_collection("crimes")
+        self.assertFalse(server.apply_published_version(dict(self.versions.docs["crimes"])))
+
+        self.assertEqual(self.versions.docs["crimes"]["version"], 1)
+        self.assertEqual(server.collection_data_versions["crimes"], 1)
+        self.assertEqual(snapshot["version"], 1)
+        self.assertTrue(server.rollup_cube_ready("crimes"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import server
+from tests.test_public_store import CRIMES, PublicStoreTestCase, install_snapshot
+
+
+class PublicStatisticsTest(PublicStoreTestCase):
+    def tearDown(self):
+        super().tearDown()
+        server.field_statistics.clear()
+
+    async def test_rollups_are_skipped_when_cells_approach_the_row_count(self):
+        server.store_field_statistics("crimes", 0, server.public_data_store["crimes"])
+        self.assertFalse(server.rollup_worthwhile("crimes", ["state", "year"]))  # 3 x 3 cells for 5 rows
+        server.field_statistics["crimes"]["records"] = 1000
+        self.assertTrue(server.rollup_worthwhile("crimes", ["state", "year"]))
+
+    async def test_load_during_a_bump_stamps_the_version_it_read(self):
+        rows = MagicMock()
+
+        async def read_rows(length):
+            server.bump_data_version("crimes")  # a write is published mid-load
+            return [dict(doc) for doc in CRIMES]
+
+        rows.find.return_value.to_list = read_rows
+        with patch.object(server, "read_collection", MagicMock(return_value=rows)), \
+                patch.object(server, "update_dataset_registry", AsyncMock()):
+            server.public_data_store.clear()
+            snapshot = await server.load_public_collection("crimes")
+        self.assertEqual((snapshot["version"], server.field_statistics["crimes"]["version"]), (0, 0))
+
+
+class UploadStatisticsTest(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        server.upload_field_statistics.clear()
+
+    async def test_least_recently_used_files_are_evicted(self):
+        snapshot = server.build_columns([{"amount": 1}, {"amount": 2}])
+        with patch.object(server, "FIELD_STATS_MAX_UPLOADS", 2):
+            for file_id in ("a", "b"):
+                server.store_field_statistics(("upload", file_id), 0, snapshot)
+            await server.get_file_field_statistics(MagicMock(), "a")  # a is used again, so b is now the oldest
+            server.store_field_statistics(("upload", "c"), 0, snapshot)
+        self.assertEqual(list(server.upload_field_statistics), [("upload", "a"), ("upload", "c")])
+        self.assertNotIn(("upload", "a"), server.field_statistics)
+
+    async def test_evicted_files_are_described_again_on_request(self):
+        rows = MagicMock()
+        rows.find.return_value.to_list = AsyncMock(return_value=[{"amount": 3}])
+        stats = await server.get_file_field_statistics(rows, "gone")
+        self.assertEqual(stats["records"], 1)
+        self.assertIn(("upload", "gone"), server.upload_field_statistics)
+
+
+class DroppedCollectionTest(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        server.field_statistics.clear()
+        server.collection_data_versions.clear()
+        server.collection_catalog["names"] = set()
+        server.collection_catalog["refreshed_at"] = None
+
+    async def test_catalog_refresh_evicts_statistics_of_dropped_collections(self):
+        snapshot = install_snapshot("crimes", CRIMES)
+        server.store_field_statistics("crimes", 0, snapshot)
+        server.store_field_statistics("aqi", 0, snapshot)
+        server.public_data_store.clear()
+        fake_db = MagicMock()
+        fake_db.list_collection_names = AsyncMock(return_value=["aqi", "users"])
+        with patch.object(server, "db", fake_db):
+            await server.refresh_collection_catalog()
+        self.assertEqual(list(server.field_statistics), ["aqi"])
+
+
+if __name__ == "__main__":
+    unittest.main()
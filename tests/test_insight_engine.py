@@ -0,0 +1,88 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+import server
+from tests.test_public_store import CRIMES, PublicStoreTestCase
+
+
+class BuildColumnsTest(unittest.TestCase):
+    def test_column_types(self):
+        frame = server.build_columns([
+            {"count": 1, "rate": 1.5, "name": "a", "seen": datetime(2021, 5, 1)},
+            {"count": 2, "rate": 2, "name": None},
+        ])
+        self.assertEqual(frame["length"], 2)
+        self.assertEqual(frame["columns"]["count"].dtype, np.int64)
+        self.assertEqual(frame["columns"]["rate"].dtype, np.float64)
+        self.assertEqual(frame["integral"]["rate"].tolist(), [False, True])
+        self.assertEqual(frame["columns"]["name"].dtype, object)
+        self.assertEqual(frame["columns"]["seen"].tolist(), ["2021-05-01T00:00:00", None])
+        self.assertEqual(frame["present"]["seen"].tolist(), [True, False])
+
+    def test_missing_integers_do_not_turn_the_column_into_floats(self):
+        frame = server.build_columns([{"count": 3}, {}])
+        self.assertEqual(frame["columns"]["count"].dtype, np.int64)
+        self.assertEqual(frame["present"]["count"].tolist(), [True, False])
+
+    def test_booleans_are_not_numbers(self):
+        frame = server.build_columns([{"flag": True}, {"flag": 1}])
+        self.assertEqual(frame["columns"]["flag"].dtype, object)
+        self.assertEqual(server.numeric_values(frame, "flag").tolist(), [1.0])
+
+
+class EngineHelpersTest(unittest.TestCase):
+    def test_numeric_values_skip_missing_and_non_numeric_entries(self):
+        frame = server.build_columns([{"v": 1.5}, {"v": float("nan")}, {}, {"v": 2}])
+        self.assertEqual(server.numeric_values(frame, "v").tolist(), [1.5, 2.0])
+        mixed = server.build_columns([{"v": 4}, {"v": "n/a"}, {"v": None}])
+        self.assertEqual(server.numeric_values(mixed, "v").tolist(), [4.0])
+        self.assertEqual(server.numeric_values(mixed, "absent").size, 0)
+
+    def test_distinct_values_are_sorted_without_nulls(self):
+        frame = server.build_columns([{"s": "Goa"}, {"s": None}, {"s": "Assam"}, {"s": "Goa"}, {"y": 2}])
+        self.assertEqual(server.distinct_values(frame, "s"), ["Assam", "Goa"])
+        self.assertEqual(server.distinct_values(frame, "y"), [2])
+
+    def test_summarize_values(self):
+        summary = server.summarize_values(np.array([2, 4, 6]), 4)
+        self.assertEqual(summary, {"records": 4, "count": 3, "sum": 12, "avg": 4.0, "min": 2, "max": 6, "std": summary["std"]})
+        self.assertAlmostEqual(summary["std"], (8 / 3) ** 0.5)
+        self.assertEqual(server.summarize_values(np.empty(0), 2)["count"], 0)
+
+
+class SnapshotInsightMetricsTest(PublicStoreTestCase):
+    def assertMetricsMatchRows(self, query, rows):
+        metrics = server.insight_metrics_from_snapshot("crimes", query)
+        expected = server.summarize_records(rows, "crimes")
+        self.assertEqual(metrics["records"], expected["records"])
+        self.assertEqual((metrics["years"], metrics["states"], metrics["crime_types"]),
+                         (expected["years"], expected["states"], expected["crime_types"]))
+        for stat, value in expected["measures"]["cases_reported"].items():
+            self.assertAlmostEqual(metrics["measures"]["cases_reported"][stat], value, msg=stat)
+
+    async def test_matches_the_row_summary(self):
+        self.assertMetricsMatchRows({}, CRIMES)
+        self.assertMetricsMatchRows({"state": {"$in": ["Goa"]}}, [row for row in CRIMES if row["state"] == "Goa"])
+
+    async def test_no_numeric_values_leave_the_statistics_null(self):
+        metrics = server.insight_metrics_from_snapshot("crimes", {"state": {"$in": ["Goa"]}, "year": {"$in": [2022]}})
+        self.assertEqual(metrics["measures"]["cases_reported"], {"count": 0, "sum": 0, "avg": None, "min": None, "max": None, "std": None})
+
+    async def test_unsupported_queries_and_collections_fall_back(self):
+        self.assertIsNone(server.insight_metrics_from_snapshot("crimes", {"$or": [{"state": "Goa"}]}))
+        self.assertIsNone(server.insight_metrics_from_snapshot("literacy", {}))
+
+    async def test_get_insight_metrics_skips_mongo_when_the_snapshot_answers(self):
+        read = MagicMock()
+        with patch.object(server, "read_collection", read):
+            metrics = await server.get_insight_metrics("crimes", {"year": {"$in": [2021]}})
+        read.assert_not_called()
+        self.assertEqual(metrics["states"], ["Goa", "Kerala"])
+        self.assertEqual(metrics["measures"]["cases_reported"]["sum"], 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
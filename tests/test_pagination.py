@@ -0,0 +1,150 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+from pymongo import ASCENDING, DESCENDING
+
+import server
+
+
+class KeysetConditionTest(unittest.TestCase):
+    def test_ascending_keys(self):
+        condition = server.keyset_condition([("cases_reported", 1), ("_id", 1)], [7, "a3"])
+        self.assertEqual(condition, {"$or": [
+            {"cases_reported": {"$gt": 7}},
+            {"cases_reported": 7, "_id": {"$gt": "a3"}},
+        ]})
+
+    def test_descending_key_includes_nulls_after_values(self):
+        condition = server.keyset_condition([("year", -1), ("_id", -1)], [2021, "a3"])
+        self.assertEqual(condition, {"$or": [
+            {"year": {"$lt": 2021}},
+            {"year": None},
+            {"year": 2021, "_id": {"$lt": "a3"}},
+            {"year": 2021, "_id": None},
+        ]})
+
+    def test_null_last_value(self):
+        # Nulls sort lowest: ascending continues with every non-null value, descending has nothing after them
+        self.assertEqual(
+            server.keyset_condition([("year", 1), ("_id", 1)], [None, "a3"]),
+            {"$or": [{"year": {"$ne": None}}, {"year": None, "_id": {"$gt": "a3"}}]}
+        )
+        self.assertEqual(
+            server.keyset_condition([("year", -1), ("_id", 1)], [None, "a3"]),
+            {"$or": [{"year": None, "_id": {"$gt": "a3"}}]}
+        )
+
+
+class ResolveIndexSortTest(unittest.TestCase):
+    def test_key_prefix_of_a_registered_index(self):
+        self.assertEqual(
+            server.resolve_index_sort("crimes", [("state", 1), ("year", 1)]),
+            [("state", ASCENDING), ("year", ASCENDING), ("_id", ASCENDING)]
+        )
+
+    def test_fully_reversed_sort_walks_the_index_backwards(self):
+        self.assertEqual(
+            server.resolve_index_sort("crimes", [("cases_reported", -1)]),
+            [("cases_reported", DESCENDING), ("_id", DESCENDING)]
+        )
+
+    def test_unindexed_or_mixed_direction_sorts(self):
+        self.assertIsNone(server.resolve_index_sort("crimes", [("month", 1)]))
+        self.assertIsNone(server.resolve_index_sort("crimes", [("state", 1), ("year", -1)]))
+        self.assertIsNone(server.resolve_index_sort("user_abc", [("state", 1)]))
+
+
+class PageTokenTest(unittest.TestCase):
+    pattern = [("state", 1), ("year", 1), ("_id", 1)]
+
+    def test_round_trip(self):
+        token = server.encode_page_token("crimes", {"year": {"$in": [2021]}}, self.pattern, {"state": "Goa", "year": 2021, "_id": "x"})
+        self.assertEqual(server.decode_page_token(token, "crimes", {"year": {"$in": [2021]}}, self.pattern), ["Goa", 2021, "x"])
+
+    def test_token_is_bound_to_its_query(self):
+        token = server.encode_page_token("crimes", {}, self.pattern, {"state": "Goa", "year": 2021, "_id": "x"})
+        with self.assertRaises(HTTPException) as raised:
+            server.decode_page_token(token, "crimes", {"state": {"$in": ["Goa"]}}, self.pattern)
+        self.assertEqual(raised.exception.status_code, 400)
+        with self.assertRaises(HTTPException):
+            server.decode_page_token("not a token", "crimes", {}, self.pattern)
+
+
+class EnsureIndexesTest(unittest.IsolatedAsyncioTestCase):
+    registry = {"crimes": {
+        "state_year": [("state", ASCENDING), ("year", ASCENDING), ("_id", ASCENDING)],
+        "year": [("year", ASCENDING), ("_id", ASCENDING)],
+    }}
+
+    def fake_db(self, existing, create_error=None):
+        collection = MagicMock()
+        collection.index_information = AsyncMock(return_value=existing)
+        collection.drop_index = AsyncMock()
+        collection.create_indexes = AsyncMock(side_effect=create_error)
+        database = MagicMock()
+        database.__getitem__.return_value = collection
+        return database, collection
+
+    async def test_recreates_indexes_whose_declared_keys_changed(self):
+        existing = {
+            "_id_": {"key": [("_id", 1)]},
+            "state_year": {"key": [("state", 1), ("year", 1)]},  # built before _id was appended
+            "year": {"key": [("year", 1), ("_id", 1)]},
+        }
+        database, collection = self.fake_db(existing)
+        with patch.object(server, "INDEX_REGISTRY", self.registry), patch.object(server, "db", database):
+            created = await server.ensure_indexes()
+        collection.drop_index.assert_awaited_once_with("state_year")
+        self.assertEqual(created, {"crimes": ["state_year", "year"]})
+
+    async def test_equivalent_index_under_another_name_is_kept(self):
+        existing = {"year_1__id_1": {"key": [("year", 1), ("_id", 1)]}}
+        database, collection = self.fake_db(existing)
+        with patch.object(server, "INDEX_REGISTRY", self.registry), patch.object(server, "db", database):
+            created = await server.ensure_indexes()
+        self.assertEqual(created, {"crimes": ["state_year"]})
+        collection.drop_index.assert_not_awaited()
+
+    async def test_creation_failures_are_raised(self):
+        database, _ = self.fake_db({}, create_error=RuntimeError("not authorized"))
+        with patch.object(server, "INDEX_REGISTRY", self.registry), patch.object(server, "db", database):
+            with self.assertRaises(RuntimeError) as raised:
+                await server.ensure_indexes()
+        self.assertIn("crimes.state_year", str(raised.exception))
+
+
+class FilteredSortTest(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        server.result_cache.clear()
+        server.usage_pending.clear()
+
+    async def request(self, **fields):
+        find = AsyncMock(return_value=[{"state": "Goa", "month": 3}])
+        patches = [
+            patch.object(server, "collection_exists", AsyncMock(return_value=True)),
+            patch.object(server, "find_documents", find),
+            patch.object(server, "count_matching_documents", AsyncMock(return_value=1)),
+            patch.object(server, "get_field_statistics", MagicMock(return_value=None)),
+        ]
+        for active in patches:
+            active.start()
+        try:
+            return await server.get_filtered_data(server.FilterRequest(collection="crimes", **fields), debug=None), find
+        finally:
+            for active in patches:
+                active.stop()
+
+    async def test_legacy_sort_by_accepts_unindexed_fields(self):
+        result, find = await self.request(sort_by="month", sort_order="desc")
+        self.assertEqual(result["returned_count"], 1)
+        self.assertEqual(find.call_args.args[2], [("month", -1)])
+
+    async def test_keyset_sort_must_be_index_backed(self):
+        with self.assertRaises(HTTPException) as raised:
+            await self.request(sort=[server.SortSpec(field="month")])
+        self.assertEqual(raised.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
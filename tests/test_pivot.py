@@ -0,0 +1,44 @@
+import unittest
+
+import server
+
+ROWS = [
+    {"state": "Goa", "year": 2021, "cases_reported_sum": 7, "count": 1},
+    {"state": "Goa", "year": 2022, "cases_reported_sum": 0, "count": 1},
+    {"state": "Kerala", "year": 2020, "cases_reported_sum": 10, "count": 1},
+    {"state": "Kerala", "year": 2021, "cases_reported_sum": 4, "count": 1},
+]
+
+
+class PivotAggregateRowsTest(unittest.TestCase):
+    def test_pivot_values_become_sorted_columns(self):
+        pivoted = server.pivot_aggregate_rows(ROWS, ["state", "year"], "year", ["cases_reported_sum"])
+        self.assertEqual(pivoted["pivot"], "year")
+        self.assertEqual(pivoted["columns"], [2020, 2021, 2022])
+        self.assertEqual(pivoted["rows"], [
+            {"state": "Goa", "values": {"cases_reported_sum": [None, 7, 0]}},
+            {"state": "Kerala", "values": {"cases_reported_sum": [10, 4, None]}},
+        ])
+
+    def test_every_measure_gets_its_own_value_list(self):
+        pivoted = server.pivot_aggregate_rows(ROWS, ["state", "year"], "state", ["cases_reported_sum", "count"])
+        self.assertEqual(pivoted["columns"], ["Goa", "Kerala"])
+        by_year = {row["year"]: row["values"] for row in pivoted["rows"]}
+        self.assertEqual(by_year[2021], {"cases_reported_sum": [7, 4], "count": [1, 1]})
+        self.assertEqual(by_year[2020], {"cases_reported_sum": [None, 10], "count": [None, 1]})
+
+    def test_null_pivot_values_sort_last(self):
+        rows = [{"state": None, "count": 2}, {"state": "Goa", "count": 1}]
+        pivoted = server.pivot_aggregate_rows(rows, ["state"], "state", ["count"])
+        self.assertEqual(pivoted["columns"], ["Goa", None])
+        self.assertEqual(pivoted["rows"], [{"values": {"count": [1, 2]}}])
+
+    def test_no_rows(self):
+        self.assertEqual(
+            server.pivot_aggregate_rows([], ["state", "year"], "year", ["count"]),
+            {"pivot": "year", "columns": [], "rows": []}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
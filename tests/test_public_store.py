@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import server
+
+CRIMES = [
+    {"state": "Kerala", "year": 2020, "crime_type": "Theft", "cases_reported": 10},
+    {"state": "Kerala", "year": 2021, "crime_type": "Fraud", "cases_reported": 4},
+    {"state": "Goa", "year": 2021, "crime_type": "Theft", "cases_reported": 7},
+    {"state": "Goa", "year": 2022, "crime_type": "Theft"},
+    {"state": "Punjab", "year": 2022, "crime_type": "Fraud", "cases_reported": 12},
+]
+
+
+def install_snapshot(collection_name, docs):
+    """Put a snapshot in the public store the way load_public_collection would"""
+    snapshot = server.build_columns(docs)
+    snapshot["masks"] = {
+        field: server.build_value_masks(snapshot["columns"][field], snapshot["present"][field])
+        for field in server.PUBLIC_STORE_MASK_FIELDS if field in snapshot["columns"]
+    }
+    snapshot["loaded_at"] = datetime.utcnow()
+    snapshot["fingerprint"] = "test"
+    snapshot["version"] = server.collection_data_versions[collection_name]
+    server.public_data_store[collection_name] = snapshot
+    return snapshot
+
+
+class PublicStoreTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        install_snapshot("crimes", CRIMES)
+
+    def tearDown(self):
+        server.public_data_store.clear()
+        server.public_store_refreshing.clear()
+        server.collection_data_versions.clear()
+        server.data_version_changed_at.clear()
+
+
+class FindInPublicStoreTest(PublicStoreTestCase):
+    async def test_filters_with_in_and_range(self):
+        docs, total = server.find_in_public_store("crimes", {"state": {"$in": ["Kerala", "Goa"]}, "year": {"$gte": 2021}})
+        self.assertEqual(total, 3)
+        self.assertEqual(sorted((doc["state"], doc["year"]) for doc in docs), [("Goa", 2021), ("Goa", 2022), ("Kerala", 2021)])
+
+    async def test_plain_equality_matches_like_in(self):
+        docs, total = server.find_in_public_store("crimes", {"year": 2022})
+        self.assertEqual(total, 2)
+        self.assertEqual({doc["state"] for doc in docs}, {"Goa", "Punjab"})
+
+    async def test_limit_caps_documents_but_not_total(self):
+        docs, total = server.find_in_public_store("crimes", {}, limit=2)
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(total, 5)
+
+    async def test_sort_puts_missing_values_first_ascending(self):
+        docs, _ = server.find_in_public_store("crimes", {}, sort_criteria=[("cases_reported", 1)])
+        self.assertNotIn("cases_reported", docs[0])
+        self.assertEqual([doc["cases_reported"] for doc in docs[1:]], [4, 7, 10, 12])
+
+    async def test_sort_descending(self):
+        docs, _ = server.find_in_public_store("crimes", {}, sort_criteria=[("cases_reported", -1)], limit=2)
+        self.assertEqual([doc["cases_reported"] for doc in docs], [12, 10])
+
+    async def test_rows_render_with_original_fields_and_types(self):
+        docs, _ = server.find_in_public_store("crimes", {"state": {"$in": ["Goa"]}, "year": {"$in": [2022]}})
+        self.assertEqual(docs, [{"state": "Goa", "year": 2022, "crime_type": "Theft"}])
+        docs, _ = server.find_in_public_store("crimes", {"year": {"$in": [2020]}})
+        self.assertIsInstance(docs[0]["cases_reported"], int)
+
+    async def test_unsupported_shapes_fall_back(self):
+        self.assertIsNone(server.find_in_public_store("crimes", {"$or": [{"state": "Goa"}]}))
+        self.assertIsNone(server.find_in_public_store("crimes", {"state": {"$regex": "^G"}}))
+        self.assertIsNone(server.find_in_public_store("crimes", {}, sort_criteria=[("state", 1), ("year", 1)]))
+
+    async def test_non_public_collection_is_not_served(self):
+        self.assertIsNone(server.find_in_public_store("user_abc", {}))
+
+
+class SnapshotVersionTest(PublicStoreTestCase):
+    async def test_version_bump_stops_serving_and_reloads(self):
+        load = AsyncMock(return_value=None)
+        with patch.object(server, "load_public_collection", load):
+            server.bump_data_version("crimes")
+            self.assertIsNone(server.find_in_public_store("crimes", {}))
+            await asyncio.sleep(0)
+        load.assert_awaited_once_with("crimes")
+        self.assertIn("crimes", server.public_store_refreshing)
+
+    async def test_current_snapshot_is_served_without_reload(self):
+        load = AsyncMock(return_value=None)
+        with patch.object(server, "load_public_collection", load):
+            self.assertIsNotNone(server.get_public_snapshot("crimes"))
+            await asyncio.sleep(0)
+        load.assert_not_awaited()
+
+
+class SnapshotBuildTest(PublicStoreTestCase):
+    async def test_build_runs_off_the_event_loop(self):
+        loop_ran = threading.Event()
+        build = server.build_public_snapshot
+
+        def blocking_build(docs):
+            # Only finishes if the event loop keeps running while the snapshot is built
+            if not loop_ran.wait(timeout=5):
+                raise AssertionError("event loop was blocked by the snapshot build")
+            return build(docs)
+
+        rows = MagicMock()
+        rows.find.return_value.to_list = AsyncMock(return_value=[dict(doc) for doc in CRIMES])
+        with patch.object(server, "read_collection", MagicMock(return_value=rows)), \
+                patch.object(server, "update_dataset_registry", AsyncMock()), \
+                patch.object(server, "build_public_snapshot", blocking_build):
+            server.public_data_store.clear()  # a first load, so nothing is published
+            load = asyncio.create_task(server.load_public_collection("crimes"))
+            await asyncio.sleep(0.01)
+            loop_ran.set()
+            snapshot = await load
+        self.assertIs(server.public_data_store["crimes"], snapshot)
+        self.assertEqual(snapshot["length"], len(CRIMES))
+        self.assertEqual(server.field_statistics["crimes"]["records"], len(CRIMES))
+        server.field_statistics.clear()
+
+
+class BackgroundTaskTest(unittest.IsolatedAsyncioTestCase):
+    async def test_task_is_referenced_until_done_and_failure_is_logged(self):
+        async def fail():
+            raise RuntimeError("boom")
+
+        with self.assertLogs(level="ERROR") as logs:
+            task = server.run_in_background(fail(), "failing job")
+            self.assertIn(task, server.background_tasks)
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.sleep(0)
+        self.assertNotIn(task, server.background_tasks)
+        self.assertTrue(any("failing job" in line and "boom" in line for line in logs.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+import server
+
+
+class BuildReadPreferenceTest(unittest.TestCase):
+    def test_defaults(self):
+        with patch.dict(os.environ, {}, clear=False):
+            for name in ("READ_PREFERENCE_ANALYTICS", "READ_MAX_STALENESS_ANALYTICS"):
+                os.environ.pop(name, None)
+            self.assertIsInstance(server.build_read_preference("primary"), Primary)
+            preference = server.build_read_preference("analytics")
+            self.assertIsInstance(preference, SecondaryPreferred)
+            self.assertEqual(preference.max_staleness, -1)
+
+    def test_max_staleness_is_raised_to_the_server_minimum(self):
+        with patch.dict(os.environ, {"READ_PREFERENCE_EXPORT": "secondary", "READ_MAX_STALENESS_EXPORT": "10"}):
+            preference = server.build_read_preference("export")
+        self.assertEqual(preference.mongos_mode, "secondary")
+        self.assertEqual(preference.max_staleness, 90)
+
+    def test_unknown_mode_uses_the_primary(self):
+        with patch.dict(os.environ, {"READ_PREFERENCE_ANALYTICS": "fastest"}):
+            self.assertIsInstance(server.build_read_preference("analytics"), Primary)
+
+
+class RoutedReadProfileTest(unittest.TestCase):
+    def setUp(self):
+        server.data_version_changed_at.clear()
+
+    def tearDown(self):
+        server.collection_data_versions.clear()
+        server.data_version_changed_at.clear()
+
+    def test_public_collections_keep_their_profile(self):
+        self.assertEqual(server.routed_read_profile("crimes", "export"), "export")
+        self.assertEqual(server.read_collection("crimes", "export").read_preference, server.read_db("export").read_preference)
+
+    def test_uploads_and_other_collections_read_from_the_primary(self):
+        self.assertEqual(server.routed_read_profile(server.UPLOADS_COLLECTION, "export"), "primary")
+        self.assertEqual(server.routed_read_profile("user_1234_sales", "analytics"), "primary")
+
+    def test_recent_writes_pin_reads_to_the_primary(self):
+        server.bump_data_version("crimes")
+        self.assertEqual(server.routed_read_profile("crimes", "export"), "primary")
+        server.data_version_changed_at["crimes"] = datetime.utcnow() - timedelta(seconds=server.READ_AFTER_WRITE_SECONDS + 1)
+        self.assertEqual(server.routed_read_profile("crimes", "export"), "export")
+
+
+class CachedVersionTest(unittest.TestCase):
+    def tearDown(self):
+        server.result_cache.clear()
+        server.collection_data_versions.clear()
+        server.data_version_changed_at.clear()
+
+    def test_result_read_before_a_bump_is_not_served_after_it(self):
+        version = server.collection_data_versions["crimes"]
+        server.bump_data_version("crimes")  # a write lands while the request is reading
+        server.result_cache_put("key", "crimes", {"data": []}, version=version)
+        self.assertIsNone(server.result_cache_get("key", "crimes"))
+
+
+@unittest.skipUnless(
+    os.environ.get("TEST_REPLICA_SET"),
+    "set TEST_REPLICA_SET=1 with MONGO_URL pointing at a replica set (e.g. mongodb://localhost:27017/?replicaSet=rs0)"
+)
+class ReplicaSetRoutingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_reads_reach_the_expected_members(self):
+        async def served_by(collection_name, profile):
+            database = server.read_db(server.routed_read_profile(collection_name, profile))
+            return await database.command("hello", read_preference=database.read_preference)
+
+        try:
+            analytics = await served_by("crimes", "analytics")
+            self.assertTrue(analytics.get("secondary"), "analytics reads should be served by a secondary")
+            self.assertTrue((await served_by("crimes", "primary")).get("isWritablePrimary"))
+            self.assertTrue((await served_by(server.UPLOADS_COLLECTION, "export")).get("isWritablePrimary"))
+            server.bump_data_version("crimes")
+            self.assertTrue((await served_by("crimes", "analytics")).get("isWritablePrimary"))
+        finally:
+            server.collection_data_versions.clear()
+            server.data_version_changed_at.clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
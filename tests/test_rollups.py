@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import server
+
+FILTERS = {"state": ["Goa"], "year": None, "crime_type": None}
+
+
+class RunAggregateRoutingTest(unittest.IsolatedAsyncioTestCase):
+    async def route(self, cube_covers):
+        rollup = AsyncMock(return_value=[{"state": "Goa", "count": 3}])
+        memory = MagicMock(return_value=[{"state": "Goa", "count": 3}])
+        raw = AsyncMock(return_value=[])
+        with patch.object(server, "rollup_can_answer", MagicMock(return_value=cube_covers)), \
+                patch.object(server, "aggregate_from_rollup", rollup), \
+                patch.object(server, "aggregate_public_store", memory), \
+                patch.object(server, "aggregate_from_raw", raw):
+            _, source = await server.run_aggregate("crimes", FILTERS, ["state"], [("*", "count")])
+        return source, rollup, memory, raw
+
+    async def test_cube_answers_before_memory(self):
+        source, rollup, memory, raw = await self.route(cube_covers=True)
+        self.assertEqual(source, "rollup")
+        rollup.assert_awaited_once()
+        memory.assert_not_called()
+        raw.assert_not_awaited()
+
+    async def test_memory_answers_when_the_cube_cannot(self):
+        source, rollup, memory, raw = await self.route(cube_covers=False)
+        self.assertEqual(source, "memory")
+        rollup.assert_not_awaited()
+        raw.assert_not_awaited()
+
+
+class RollupCubeDefinitionTest(unittest.TestCase):
+    def test_aqi_cube_aggregates_the_stored_field(self):
+        self.assertEqual(server.ROLLUP_CUBES["aqi"]["measures"], ["avg_aqi"])
+        self.assertEqual(server.INSIGHT_MEASURES["aqi"], ["avg_aqi"])
+
+
+class MeasureSummaryTest(unittest.IsolatedAsyncioTestCase):
+    async def test_collections_without_a_consumer_are_skipped(self):
+        run = AsyncMock()
+        with patch.object(server, "run_aggregate", run):
+            self.assertIsNone(await server.get_measure_summary("covid_stats", {"state": ["Goa"]}))
+        run.assert_not_awaited()
+
+    async def test_summary_and_breakdown(self):
+        async def run(collection_name, filters, group_by, measures, profile="analytics"):
+            if group_by:
+                return [{"crime_type": "Theft", "cases_reported_sum": 17}, {"crime_type": None, "cases_reported_sum": 2}], "memory"
+            return [{"count": 3, "cases_reported_count": 3, "cases_reported_sum": 19, "cases_reported_avg": 19 / 3,
+                     "cases_reported_min": 2, "cases_reported_max": 10}], "memory"
+
+        with patch.object(server, "run_aggregate", run):
+            summary = await server.get_measure_summary("crimes", FILTERS, breakdown_by="crime_type")
+        self.assertEqual(summary["summary"]["sum"], 19)
+        self.assertEqual(summary["breakdown"], {"Theft": 17, "Unknown": 2})
+
+
+class SpecificResponseTest(unittest.IsolatedAsyncioTestCase):
+    async def test_aqi_answers_read_avg_aqi(self):
+        query_info = {"collection": "aqi", "data_type": "air quality", "states": ["delhi"], "years": [2021]}
+        rows = [{"state": "Delhi", "year": 2021, "avg_aqi": 180}, {"state": "Delhi", "year": 2021, "avg_aqi": 120}]
+        response = await server.generate_specific_response(rows, query_info)
+        self.assertIn("Average AQI**: 150.0", response)
+        self.assertIn("Records Analyzed**: 2", response)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+
+import server
+
+DAILY_ROWS = [
+    {"_id": "a1", "state": "Kerala", "date": "2021-05-01", "year": 2021, "month": 5, "confirmed": 120, "deaths": 2, "recovered": 90},
+    {"_id": "a2", "state": "Kerala", "date": "2021-05-02", "year": 2021, "month": 5, "confirmed": 150, "deaths": 3, "recovered": 95},
+]
+
+
+class ChooseGranularityTest(unittest.TestCase):
+    def test_open_spans_use_months(self):
+        self.assertEqual(server.choose_granularity(None, None), "month")
+        self.assertEqual(server.choose_granularity("2021-01-01", None), "month")
+
+    def test_span_thresholds(self):
+        self.assertEqual(server.choose_granularity("2021-01-01", "2021-04-02"), "day")  # 92 days
+        self.assertEqual(server.choose_granularity("2021-01-01", "2021-04-03"), "week")
+        self.assertEqual(server.choose_granularity("2020-01-01", "2021-12-31"), "week")  # 731 days
+        self.assertEqual(server.choose_granularity("2020-01-01", "2022-01-01"), "month")
+
+
+class TimeBucketStartTest(unittest.TestCase):
+    def test_weeks_start_on_monday(self):
+        self.assertEqual(server.time_bucket_start("2021-05-06", "week"), "2021-05-03")  # Thursday
+        self.assertEqual(server.time_bucket_start("2021-05-03", "week"), "2021-05-03")
+        self.assertEqual(server.time_bucket_start("2021-01-02", "week"), "2020-12-28")
+
+    def test_months_start_on_the_first(self):
+        self.assertEqual(server.time_bucket_start("2021-05-31", "month"), "2021-05-01")
+
+    def test_bucket_collection_names(self):
+        self.assertEqual(server.time_bucket_collection("covid_stats", "week"), "rollup_covid_stats_week")
+
+
+def matches(doc, query):
+    """Evaluate the few query operators new_days_query emits against one row"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+        elif field == "$nor":
+            if any(matches(doc, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = doc.get(field)
+            if "$type" in condition and not isinstance(value, str):
+                return False
+            if "$gt" in condition and not (value is not None and value > condition["$gt"]):
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeRollupDb:
+    """Raw covid_stats rows plus the last_date each state's merged buckets reached"""
+
+    def __init__(self, rows, merged):
+        self.rows, self.merged, self.pipelines = rows, merged, []
+
+    def __getitem__(self, name):
+        collection = MagicMock()
+        if name == "covid_stats":
+            async def find_one(query, projection=None, sort=None):
+                found = sorted((row for row in self.rows if matches(row, query)), key=lambda row: row["date"])
+                return found[0] if found else None
+
+            def aggregate(pipeline):
+                self.pipelines.append(pipeline)
+                return MagicMock(to_list=AsyncMock(return_value=[]))
+
+            collection.find_one = find_one
+            collection.aggregate = aggregate
+        else:
+            watermarks = [{"_id": {"state": state}, "last_date": last_date} for state, last_date in self.merged.items()]
+            collection.aggregate = MagicMock(return_value=MagicMock(to_list=AsyncMock(return_value=watermarks)))
+            collection.create_index = AsyncMock()
+            collection.count_documents = AsyncMock(return_value=2)
+        return collection
+
+
+class IncrementalTimeBucketTest(unittest.IsolatedAsyncioTestCase):
+    ROWS = [
+        {"state": "Assam", "date": "2023-05-19"},
+        {"state": "Assam", "date": "2023-05-20"},
+        {"state": "Bihar", "date": "2023-05-10"},
+    ]
+
+    def tearDown(self):
+        server.time_bucket_status.clear()
+
+    async def build(self, rows, merged, granularity="week"):
+        fake_db = FakeRollupDb(rows, merged)
+        with patch.object(server, "db", fake_db):
+            updated = await server.build_time_bucket_rollup("covid_stats", granularity)
+        since = fake_db.pipelines[0][0]["$match"]["date"]["$gte"] if fake_db.pipelines else None
+        return updated, since
+
+    async def test_late_row_of_one_state_is_merged(self):
+        # Assam already reached 2023-05-20; Bihar's 2023-05-11 arrives after that build
+        rows = self.ROWS + [{"state": "Bihar", "date": "2023-05-11"}]
+        merged = {"Assam": "2023-05-20", "Bihar": "2023-05-10"}
+        self.assertEqual(await self.build(rows, merged), (2, "2023-05-08"))
+        self.assertEqual(await self.build(rows, merged, "month"), (2, "2023-05-01"))
+
+    async def test_state_without_buckets_is_merged_from_its_first_day(self):
+        rows = self.ROWS + [{"state": "Goa", "date": "2023-04-02"}]
+        self.assertEqual((await self.build(rows, {"Assam": "2023-05-20", "Bihar": "2023-05-10"}))[1], "2023-03-27")
+
+    async def test_nothing_new_skips_the_merge(self):
+        self.assertEqual(await self.build(self.ROWS, {"Assam": "2023-05-20", "Bihar": "2023-05-10"}), (0, None))
+        self.assertIn("week", server.time_bucket_status["covid_stats"])
+
+    async def test_first_build_merges_everything(self):
+        self.assertEqual((await self.build(self.ROWS, {}))[1], "2023-05-08")
+
+
+class VisualizeCovidTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.find = AsyncMock(side_effect=lambda *args, **kwargs: [dict(row) for row in DAILY_ROWS])
+        self.buckets = AsyncMock(return_value=[{"state": "Kerala", "period_start": "2021-05-01", "confirmed_sum": 270, "days": 2}])
+        metadata = server.CollectionMetadata(collection="covid_stats", available_states=["Kerala"], available_years=[2021], available_fields=["date"])
+        self.patches = [
+            patch.object(server, "collection_exists", AsyncMock(return_value=True)),
+            patch.object(server, "find_documents", self.find),
+            patch.object(server, "find_time_buckets", self.buckets),
+            patch.object(server, "get_insight_metrics", AsyncMock(return_value=None)),
+            patch.object(server, "get_collection_metadata", AsyncMock(return_value=metadata)),
+            patch.object(server, "get_field_statistics", MagicMock(return_value=None)),
+        ]
+        for active in self.patches:
+            active.start()
+
+    def tearDown(self):
+        for active in self.patches:
+            active.stop()
+        server.usage_pending.clear()
+
+    async def test_default_request_returns_daily_rows(self):
+        # What DataExplorer sends: states, years and limit only
+        result = await server.get_visualization_data("covid_stats", limit=25, states="Kerala", years="2021")
+        self.assertEqual(
+            set(result), {"collection", "data", "chart_recommendations", "ai_insights", "total_records", "metadata", "query_used"}
+        )
+        self.assertEqual(result["query_used"], {"state": {"$in": ["Kerala"]}, "year": {"$in": [2021]}})
+        self.assertEqual(result["data"][0], {k: v for k, v in DAILY_ROWS[0].items() if k != "_id"})
+        self.assertEqual(result["total_records"], 2)
+        self.assertEqual(self.find.call_args.kwargs["limit"], 25)
+        self.buckets.assert_not_awaited()
+
+    async def test_explicit_granularity_reads_buckets(self):
+        server.time_bucket_status["covid_stats"]["month"] = {"built_at": None}
+        try:
+            result = await server.get_visualization_data("covid_stats", granularity="month", states="Kerala")
+        finally:
+            server.time_bucket_status.clear()
+        self.assertEqual(result["granularity"], "month")
+        self.assertEqual(result["data"][0]["confirmed_sum"], 270)
+        self.buckets.assert_awaited_once()
+
+    async def test_short_date_range_uses_daily_rows(self):
+        result = await server.get_visualization_data("covid_stats", start_date="2021-05-01", end_date="2021-05-31")
+        self.assertEqual((result["granularity"], result["granularity_requested"]), ("day", "auto"))
+        self.assertEqual(self.find.call_args.args[1], {"date": {"$gte": "2021-05-01", "$lte": "2021-05-31"}})
+
+    async def test_invalid_parameters(self):
+        with self.assertRaises(HTTPException) as raised:
+            await server.get_visualization_data("covid_stats", granularity="hour")
+        self.assertEqual(raised.exception.status_code, 400)
+        with self.assertRaises(HTTPException):
+            await server.get_visualization_data("covid_stats", start_date="05/01/2021")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import server
+
+
+class UploadProcessingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_uploaded_rows_keep_their_own_fields(self):
+        """A date column in a user file must not gain derived year/month fields"""
+        rows = MagicMock()
+        rows.insert_many = AsyncMock()
+        uploads_db = MagicMock()
+        uploads_db.__getitem__.return_value = rows
+        files = MagicMock()
+        files.insert_one = AsyncMock()
+        app_db = MagicMock()
+        app_db.__getitem__.return_value = files
+
+        content = b"date,state,value\n2021-03-04,Kerala,5\n2021-04-05,Goa,7\n"
+        with patch.object(server, "uploads_db", uploads_db), patch.object(server, "db", app_db):
+            result = await server.process_uploaded_file(content, "values.csv", "user-1")
+
+        self.assertEqual(result["record_count"], 2)
+        stored = rows.insert_many.call_args.args[0]
+        for record in stored:
+            self.assertNotIn("year", record)
+            self.assertNotIn("month", record)
+        self.assertEqual(
+            set(stored[0]), {"date", "state", "value", "file_id", "filename", "upload_date", "user_id"}
+        )
+
+
+class UploadSchemaCacheTest(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        server.upload_schema_cache.clear()
+        server.schema_cache.clear()
+
+    async def test_per_file_schemas_are_evicted_least_recently_used_first(self):
+        rows = MagicMock()
+        rows.aggregate.return_value.to_list = AsyncMock(return_value=[])
+        uploads = MagicMock()
+        uploads.name = "uploads"
+        uploads.__getitem__.return_value = rows
+
+        async def open_file(file_id):
+            await server.get_collection_schema("file_rows", {"file_id": file_id}, database=uploads)
+
+        with patch.object(server, "FIELD_STATS_MAX_UPLOADS", 2):
+            for file_id in ("a", "b", "a", "c"):
+                await open_file(file_id)
+        keys = [server.single_flight_key(match) for match in ({"file_id": "a"}, {"file_id": "c"})]
+        self.assertEqual(list(server.upload_schema_cache), [("uploads", "file_rows", key) for key in keys])
+        self.assertEqual(rows.aggregate.call_count, 3)  # the second open of "a" was a hit
+        self.assertEqual(server.schema_cache, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
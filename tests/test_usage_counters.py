@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+from pymongo.errors import BulkWriteError
+
+import server
+
+
+class UsageCounterTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.counters = MagicMock()
+        fake_db = MagicMock()
+        fake_db.__getitem__.return_value = self.counters
+        self.patch = patch.object(server, "db", fake_db)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        server.usage_pending.clear()
+        server.usage_totals.clear()
+
+
+class FlushUsageCountersTest(UsageCounterTestCase):
+    def count(self):
+        for _ in range(3):
+            server.count_usage("chat", "crimes")
+        server.count_usage("visualize", "aqi")
+        server.count_usage("aggregate", "literacy")
+
+    async def test_successful_flush_moves_deltas_to_totals(self):
+        self.count()
+        self.counters.bulk_write = AsyncMock()
+        await server.flush_usage_counters()
+        self.assertEqual(dict(server.usage_pending), {})
+        self.assertEqual(server.usage_totals[("chat", "crimes")], 3)
+        operations = self.counters.bulk_write.call_args.args[0]
+        self.assertEqual([op._doc["$inc"]["count"] for op in operations], [3, 1, 1])
+
+    async def test_bulk_write_error_requeues_only_failed_operations(self):
+        self.count()
+        error = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}], "nInserted": 0})
+        self.counters.bulk_write = AsyncMock(side_effect=error)
+        with self.assertRaises(BulkWriteError):
+            await server.flush_usage_counters()
+        self.assertEqual(dict(server.usage_pending), {("visualize", "aqi"): 1})
+        self.assertEqual(dict(server.usage_totals), {("chat", "crimes"): 3, ("aggregate", "literacy"): 1})
+
+        # The next flush writes only the failed delta, so nothing is counted twice
+        self.counters.bulk_write = AsyncMock()
+        await server.flush_usage_counters()
+        operations = self.counters.bulk_write.call_args.args[0]
+        self.assertEqual([(op._filter["_id"], op._doc["$inc"]["count"]) for op in operations], [("visualize:aqi", 1)])
+        self.assertEqual(sum(server.usage_totals.values()), 5)
+
+    async def test_other_errors_requeue_everything(self):
+        self.count()
+        self.counters.bulk_write = AsyncMock(side_effect=ConnectionError("down"))
+        with self.assertRaises(ConnectionError):
+            await server.flush_usage_counters()
+        self.assertEqual(sum(server.usage_pending.values()), 5)
+        self.assertEqual(dict(server.usage_totals), {})
+
+
+class CountAfterValidationTest(UsageCounterTestCase):
+    async def test_rejected_requests_are_not_counted(self):
+        requests = [
+            server.get_visualization_data("covid_stats", granularity="hour"),
+            server.get_filtered_data(server.FilterRequest(collection="crimes", sort=[{"field": "district"}]), debug=None),
+            server.get_filtered_data(server.FilterRequest(collection="crimes", page_token="not-a-token"), debug=None),
+        ]
+        with patch.object(server, "collection_exists", AsyncMock(return_value=True)):
+            for request in requests:
+                with self.assertRaises(HTTPException) as raised:
+                    await request
+                self.assertEqual(raised.exception.status_code, 400)
+        self.counters.find_one = AsyncMock(return_value=None)
+        with self.assertRaises(HTTPException) as raised:
+            await server.get_user_file_insights("missing", {}, user_data={"user_id": "u1"})
+        self.assertEqual(raised.exception.status_code, 404)
+        self.assertEqual(dict(server.usage_pending), {})
+
+
+if __name__ == "__main__":
+    unittest.main()